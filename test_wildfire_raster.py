@@ -0,0 +1,51 @@
+import numpy as np
+from PIL import Image
+
+from wildfire_raster import load_condition_layers
+
+
+def save_mask_png(path, mask):
+    Image.fromarray(np.where(mask, 255, 0).astype(np.uint8)).save(path)
+
+
+def test_mean_resampled_png_mask_keeps_sparse_cells_false(tmp_path):
+    # One white pixel in every 10x10 block is 1% coverage, far below half of any block.
+    mask = np.zeros((400, 400), dtype=bool)
+    mask[::10, ::10] = True
+    path = tmp_path / "lightning.png"
+    save_mask_png(path, mask)
+
+    layers = load_condition_layers(lightning=path, shape=(40, 40), method="mean")
+
+    assert layers["lightning"].dtype == bool
+    assert not layers["lightning"].any()
+
+
+def test_mean_resampled_png_mask_thresholds_block_coverage(tmp_path):
+    mask = np.zeros((400, 400), dtype=bool)
+    mask[:10, :6] = True
+    mask[10:20, :4] = True
+    mask[20:30, :] = True
+    path = tmp_path / "rain.png"
+    save_mask_png(path, mask)
+
+    rain = load_condition_layers(rain=path, shape=(40, 40), method="mean")["rain"]
+
+    assert rain[0, 0]
+    assert not rain[1, 0]
+    assert rain[2].all()
+    assert rain.sum() == 1 + 40
+
+
+def test_nearest_and_mean_agree_on_png_and_array_masks(tmp_path):
+    mask = np.zeros((400, 400), dtype=bool)
+    mask[:200, :] = True
+    path = tmp_path / "rain.png"
+    save_mask_png(path, mask)
+
+    expected = np.zeros((40, 40), dtype=bool)
+    expected[:20, :] = True
+    for source in (path, mask.astype(np.uint8)):
+        for method in ("nearest", "mean"):
+            rain = load_condition_layers(rain=source, shape=(40, 40), method=method)["rain"]
+            np.testing.assert_array_equal(rain, expected)
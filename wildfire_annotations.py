@@ -0,0 +1,37 @@
+import numpy as np
+
+
+def annotation_text(lightning, rain, temperature):
+    raining_txt = "True" if rain else "False"
+    lightning_txt = "True" if lightning else "False"
+    return 'Rain: ' + raining_txt + '<br>Temp: ' + str(temperature) + '<br>Lightning: ' + lightning_txt
+
+
+def annotation_matrix(lightning, rain, temperature, window=None):
+    # Builds the same text as annotation_text for every cell, or only for the cells inside
+    # window (a pair of slices, e.g. the visible viewport). Object arrays never truncate.
+    if window is not None:
+        lightning, rain, temperature = lightning[window], rain[window], temperature[window]
+    rain_text = np.where(rain, 'Rain: True<br>Temp: ', 'Rain: False<br>Temp: ').astype(object)
+    temperature_text = np.asarray(temperature).astype(str).astype(object)
+    lightning_text = np.where(lightning, '<br>Lightning: True', '<br>Lightning: False').astype(object)
+    return rain_text + temperature_text + lightning_text
+
+
+def selected_area_annotation(forest, coord_x, coord_y):
+    # Text shown next to the forest after clicking a cell, one sentence per line.
+    annotation = f'The selected area ({coord_x}, {coord_y}) is '
+    if forest.wildfires[coord_y, coord_x]:
+        annotation += "burning."
+    else:
+        annotation += "not burning."
+    annotation += f'The temperature is {forest.get_temperature(coord_x, coord_y)}°C.It is '
+    if forest.is_raining(coord_x, coord_y):
+        annotation += 'raining.There are '
+    else:
+        annotation += 'not raining.There are '
+    if forest.is_lightning(coord_x, coord_y):
+        annotation += 'lightning strikes in the area.'
+    else:
+        annotation += 'no lightning strikes in the area.'
+    return annotation.split('.')[:4]
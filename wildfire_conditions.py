@@ -0,0 +1,118 @@
+import numpy as np
+
+
+# Lightning and rain are stored as bool layers and temperature as a small integer, which is
+# 8x and 4x smaller than the int64 arrays the generators return.
+TEMPERATURE_DTYPE = np.int16
+
+
+def smooth_rows(values):
+    # Same result as np.convolve(row, [0.25, 0.25, 0.25, 0.25], mode='same') cast back to int for
+    # every row, computed for all rows at once with shifted in-place sums.
+    smoothed = values.copy()
+    smoothed[:, :-1] += values[:, 1:]
+    smoothed[:, 1:] += values[:, :-1]
+    smoothed[:, 2:] += values[:, :-2]
+    # Divide by four rounding towards zero like the float to int cast does.
+    negative = smoothed < 0
+    np.abs(smoothed, out=smoothed)
+    smoothed //= 4
+    np.negative(smoothed, out=smoothed, where=negative)
+    return smoothed
+
+
+def generate_temperature_field(random_number_generator, shape, highest_temperature, flipped=True):
+    size_of_x, size_of_y = shape
+    # A gradient between two random temperature vectors, smoothed along the vectors. The flipped
+    # variant runs the gradient along y instead of x.
+    vector_length, steps = (size_of_x, size_of_y) if flipped else (size_of_y, size_of_x)
+    lowest_temperature_vector = random_number_generator.normal(0, 1, size=vector_length) * 10
+    highest_temperature_vector = lowest_temperature_vector + highest_temperature - np.max(lowest_temperature_vector)
+    temperature = np.linspace(start=lowest_temperature_vector, stop=highest_temperature_vector, num=steps, dtype=np.int32)
+    temperature = smooth_rows(temperature)
+    temperature += highest_temperature - np.max(temperature)
+    if flipped:
+        temperature = np.flip(temperature).T
+    return temperature.astype(TEMPERATURE_DTYPE)
+
+
+def generate_condition_layer(random_number_generator, probability, shape, chunk_size=2**20):
+    # Same values as random_number_generator.binomial(n=1, p=probability, size=shape), drawn in
+    # blocks of rows so only one block at a time is held as int64.
+    layer = np.empty(shape, dtype=bool)
+    rows_per_chunk = max(1, chunk_size // max(shape[1], 1))
+    for start in range(0, shape[0], rows_per_chunk):
+        stop = min(start + rows_per_chunk, shape[0])
+        layer[start:stop] = random_number_generator.binomial(n=1, p=probability, size=(stop - start, shape[1]))
+    return layer
+
+
+def seed_sequence(seed=None):
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def spawn_seeds(seed, number_of_streams):
+    # Independent child streams, e.g. one per worker process, that are reproducible from the parent seed.
+    return seed_sequence(seed).spawn(number_of_streams)
+
+
+def generate_elevation_layer(random_number_generator, shape, highest_elevation=1000, ridge_width=0.25):
+    # A ridge along the western edge (column 0), where the Drawer draws its mountains, falling off
+    # to the east over about ridge_width of the grid. The ridge height varies smoothly from north
+    # to south and the slopes get some small scale roughness.
+    size_of_rows, size_of_columns = shape
+    ridge_profile = random_number_generator.normal(0, 1, size=size_of_rows)
+    ridge_profile = np.convolve(ridge_profile, np.ones(5) / 5, mode="same")
+    ridge_profile = 0.75 + 0.25 * np.tanh(ridge_profile)
+    distance = np.arange(size_of_columns) / max(ridge_width * size_of_columns, 1)
+    elevation = highest_elevation * ridge_profile[:, None] * np.exp(-distance ** 2)[None, :]
+    elevation += random_number_generator.normal(0, 0.002 * highest_elevation, size=shape)
+    np.maximum(elevation, 0, out=elevation)
+    return elevation.astype(np.float32)
+
+
+def wind_step(wind):
+    # The one of the eight grid directions closest to a (wind_x, wind_y) vector, x pointing east and y south.
+    wind_x, wind_y = (float(component) for component in wind)
+    if wind_x == 0 and wind_y == 0:
+        raise ValueError("The wind needs a direction to cast a rain shadow")
+    angle = np.arctan2(wind_y, wind_x)
+    step = int(np.round(angle / (np.pi / 4))) % 8
+    return ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))[step]
+
+
+def rain_shadow_depth(elevation, wind=(1, 0), lapse=0.0):
+    # How far each cell lies below the shadow line cast by the terrain upwind of it. The shadow
+    # line of a cell is max over upwind cells k of elevation[k] - lapse * distance to k, which is
+    # a running maximum along the wind, so the whole grid takes one pass. Cells without any
+    # terrain upwind get -inf.
+    elevation = np.asarray(elevation, dtype=np.float64)
+    step_x, step_y = wind_step(wind)
+    # Flip the grid so the wind blows towards increasing columns, and rows for diagonal winds.
+    flips = tuple(axis for axis, component in ((0, step_y), (1, step_x)) if component < 0)
+    grid = np.flip(elevation, axis=flips) if flips else elevation
+    if step_x == 0:
+        grid = grid.T
+
+    barrier = np.full(grid.shape, -np.inf)
+    if step_x != 0 and step_y != 0:
+        # Diagonal wind, each row continues the shadow line of the row above shifted by one column.
+        diagonal_lapse = lapse * np.sqrt(2)
+        for row in range(1, grid.shape[0]):
+            np.maximum(grid[row - 1, :-1], barrier[row - 1, :-1], out=barrier[row, 1:])
+            barrier[row, 1:] -= diagonal_lapse
+    elif grid.shape[1] > 1:
+        columns = np.arange(grid.shape[1])
+        highest = np.maximum.accumulate(grid + lapse * columns, axis=1)
+        barrier[:, 1:] = highest[:, :-1] - lapse * columns[1:]
+
+    depth = barrier - grid
+    if step_x == 0:
+        depth = depth.T
+    return np.flip(depth, axis=flips) if flips else depth
+
+
+def generate_rain_shadow_layer(elevation, wind=(1, 0), lapse=0.0, minimum_depth=0.0):
+    return rain_shadow_depth(elevation, wind=wind, lapse=lapse) > minimum_depth
@@ -0,0 +1,225 @@
+import numpy as np
+
+from wildfire_annotations import annotation_matrix, annotation_text
+from wildfire_conditions import generate_condition_layer, generate_elevation_layer, generate_rain_shadow_layer, generate_temperature_field, seed_sequence
+from wildfire_raster import load_condition_layers
+from wildfire_rules import WILDFIRE_RULES, compile_rules, score_predictions
+
+
+# The rain condition is inverted compared to WILDFIRE_RULES, as used by wildfire_src.py.
+RAIN_RULES = (
+    (("lightning", "==", True),),
+    (("temperature", ">", 55), ("rain", "==", True)),
+)
+
+
+class Forest:
+    # The notebooks differ only in these settings, the variants below set them for each front end.
+    rules = WILDFIRE_RULES
+    size_x = 20
+    size_y = 20
+    flipped_temperature = True
+    # Whether the ridge on the western edge keeps the rain off the cells in its lee.
+    orographic_rain = True
+    # The prevailing wind as (wind_x, wind_y), x pointing east and y south.
+    prevailing_wind = (1.0, 0.0)
+    highest_elevation = 1000
+    ridge_width = 0.25
+    # Answer of the rain dropdown for which the predicted rule requires rain.
+    rain_answer = "No"
+    # Whether __init__ draws a first scenario. Front ends that regenerate the forest before showing
+    # it skip this, so their first scenario gets the first child seed.
+    scenario_on_init = True
+
+    def __init__(self, rules=None, seed=None, size_x=None, size_y=None):
+        self.wildfire_rules = compile_rules(self.rules if rules is None else rules)
+        self.seed_sequence = seed_sequence(seed)
+        self.scenario_seed = None
+        self.temperature = None
+        self.rain = None
+        self.lightning = None
+        self.wildfires = None
+        self.elevation = None
+        self.rain_shadow = None
+        self.rain_shadow_wind = None
+        if size_x is not None:
+            self.size_x = size_x
+        if size_y is not None:
+            self.size_y = size_y
+        if self.orographic_rain:
+            # Drawn before the first scenario, the terrain then stays put while the scenarios change.
+            self.construct_elevation(shape=(self.size_x, self.size_y))
+        if self.scenario_on_init:
+            self.construct_wildfire_matrix(self.size_x, self.size_y, probability_of_rain=0.4, probability_of_lightning=0.2, highest_temperature=90)
+
+    def generate_specific_forest_conditions(self, size_of_x, size_of_y, probability_of_rain, probability_of_lightning, highest_temperature, seed=None):
+        random_number_generator = np.random.default_rng(seed)
+        lightning = generate_condition_layer(random_number_generator, probability_of_lightning, (size_of_x, size_of_y))
+        rain = generate_condition_layer(random_number_generator, probability_of_rain, (size_of_x, size_of_y))
+        if self.orographic_rain:
+            rain &= ~self.construct_rain_shadow(shape=rain.shape)
+        temperature = generate_temperature_field(random_number_generator, (size_of_x, size_of_y), highest_temperature, flipped=self.flipped_temperature)
+        return lightning, rain, temperature
+
+    def construct_annotation_matrix(self, lightning, rain, temperature, window=None):
+        return annotation_matrix(lightning, rain, temperature, window=window)
+
+    def annotation_at(self, x_coordinate, y_coordinate):
+        return annotation_text(self.lightning[y_coordinate, x_coordinate],
+                               self.rain[y_coordinate, x_coordinate],
+                               self.temperature[y_coordinate, x_coordinate])
+
+    def construct_wildfire_matrix(self, size_x, size_y, probability_of_rain = 0.3, probability_of_lightning = 0.4, highest_temperature=85, seed=None):
+        # Every scenario gets its own child seed so it can be replayed by passing forest.scenario_seed back in.
+        if seed is None:
+            seed = self.seed_sequence.spawn(1)[0]
+        self.scenario_seed = seed
+        self.lightning, self.rain, self.temperature = self.generate_specific_forest_conditions(size_of_x=size_x,
+                                                                               size_of_y=size_y,
+                                                                               probability_of_rain=probability_of_rain,
+                                                                               probability_of_lightning=probability_of_lightning,
+                                                                               highest_temperature=highest_temperature,
+                                                                               seed=seed)
+
+        wildfires = self.wildfire_rules.evaluate(self.condition_layers())
+        wildfires = wildfires.astype(self.lightning.dtype)
+        self.wildfires = wildfires
+        return wildfires
+
+    def load_conditions(self, lightning=None, rain=None, temperature=None, elevation=None, shape=None, window=None, method="nearest"):
+        # Replaces the random conditions with measured ones from arrays or raster files, see
+        # wildfire_raster. Layers that are not given keep their values and must match the grid.
+        layers = load_condition_layers(lightning=lightning,
+                                       rain=rain,
+                                       temperature=temperature,
+                                       elevation=elevation,
+                                       shape=shape,
+                                       window=window,
+                                       method=method)
+        missing = [name for name in ("lightning", "rain", "temperature") if name not in layers and getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"The forest has no {', '.join(missing)} layer yet, load it too")
+        shapes = {name: layers[name].shape if name in layers else getattr(self, name).shape
+                  for name in ("lightning", "rain", "temperature")}
+        if len(set(shapes.values())) > 1:
+            raise ValueError(f"Condition layers have different shapes: {shapes}")
+        shape = shapes["lightning"]
+        if "elevation" in layers and layers["elevation"].shape != shape:
+            raise ValueError(f"The elevation has shape {layers['elevation'].shape}, the condition layers {shape}")
+        for name, values in layers.items():
+            setattr(self, name, values)
+        self.size_x, self.size_y = shape
+        if "elevation" in layers:
+            # Measured rain already has the shadow in it, the layer is only kept for is_rainshadow.
+            self.rain_shadow = None
+            if self.orographic_rain:
+                self.construct_rain_shadow()
+        elif self.elevation is not None and self.elevation.shape != shape:
+            # The terrain of the previous grid does not cover the loaded one.
+            self.elevation = None
+            self.rain_shadow = None
+
+        self.scenario_seed = None
+        wildfires = self.wildfire_rules.evaluate(self.condition_layers())
+        self.wildfires = wildfires.astype(self.lightning.dtype)
+        return self.wildfires
+
+    def construct_elevation(self, highest_elevation=None, ridge_width=None, seed=None, shape=None):
+        # Elevation has its own seed, so adding it does not change the conditions of a scenario.
+        if seed is None:
+            seed = self.seed_sequence.spawn(1)[0]
+        self.elevation = generate_elevation_layer(np.random.default_rng(seed),
+                                                  self.lightning.shape if shape is None else shape,
+                                                  highest_elevation=self.highest_elevation if highest_elevation is None else highest_elevation,
+                                                  ridge_width=self.ridge_width if ridge_width is None else ridge_width)
+        self.rain_shadow = None
+        return self.elevation
+
+    def construct_rain_shadow(self, wind=None, shape=None):
+        # The terrain stays the same between scenarios, so the shadow is only recomputed for a new
+        # elevation or wind. Changing the wind takes one pass over the grid.
+        wind = self.prevailing_wind if wind is None else tuple(wind)
+        shape = self.lightning.shape if shape is None else tuple(shape)
+        if self.elevation is None or self.elevation.shape != shape:
+            self.construct_elevation(shape=shape)
+        if self.rain_shadow is None or self.rain_shadow_wind != wind:
+            # The shadow line drops by the ridge height over twice the ridge width, so the shadow
+            # covers about the same share of the grid at every size.
+            # Hollows shallower than 2% of the ridge are roughness, not shadow.
+            highest = float(self.elevation.max())
+            lapse = highest / max(2 * self.ridge_width * shape[1], 1)
+            self.rain_shadow = generate_rain_shadow_layer(self.elevation, wind=wind, lapse=lapse, minimum_depth=0.02 * highest)
+            self.rain_shadow_wind = wind
+        return self.rain_shadow
+
+    def condition_layers(self):
+        return {"lightning": self.lightning, "rain": self.rain, "temperature": self.temperature}
+
+    def prediction_rules(self, lightning_value, temp_value, rain_value):
+        return ((("lightning", "==", lightning_value == "Yes"),),
+                (("temperature", ">", temp_value), ("rain", "==", rain_value == self.rain_answer)))
+
+    def predict_area_on_fire(self, x_coordinate, y_coordinate, lightning_value, temp_value, rain_value):
+        prediction_rules = compile_rules(self.prediction_rules(lightning_value, temp_value, rain_value))
+        return bool(prediction_rules.evaluate(self.condition_layers(), index=(x_coordinate, y_coordinate)))
+
+    def predict_grid(self, lightning_value, temp_value, rain_value):
+        prediction_rules = compile_rules(self.prediction_rules(lightning_value, temp_value, rain_value))
+        predictions = prediction_rules.evaluate(self.condition_layers())
+        wildfires = self.wildfires.astype(bool)
+        mismatches = predictions != wildfires
+        return predictions, mismatches, score_predictions(predictions, wildfires)
+
+    def is_lightning(self, x_coordinate, y_coordinate):
+        return bool(self.lightning[y_coordinate, x_coordinate])
+
+    def is_rainshadow(self, x_coordinate, y_coordinate):
+        if self.rain_shadow is None:
+            return False
+        return bool(self.rain_shadow[y_coordinate, x_coordinate])
+
+    def is_raining(self, x_coordinate, y_coordinate):
+        return bool(self.rain[y_coordinate, x_coordinate])
+
+    def get_temperature(self, x_coordinate, y_coordinate):
+        return self.temperature[y_coordinate, x_coordinate]
+
+
+class ExpertForest(Forest):
+    pass
+
+
+class SrcForest(Forest):
+    rules = RAIN_RULES
+    size_x = 30
+    size_y = 30
+    flipped_temperature = False
+    orographic_rain = False
+    rain_answer = "Yes"
+
+
+class ColabForest(SrcForest):
+    size_x = 20
+    size_y = 20
+
+
+class LargerForest(Forest):
+    size_x = 35
+    size_y = 35
+    orographic_rain = False
+    scenario_on_init = False
+
+
+# Front ends pick their forest by name, e.g. the headless renderer and the ensemble runner.
+FOREST_VARIANTS = {
+    "expert": ExpertForest,
+    "src": SrcForest,
+    "colab": ColabForest,
+    "larger": LargerForest,
+}
+
+
+def make_forest(variant="expert", **kwargs):
+    if variant not in FOREST_VARIANTS:
+        raise ValueError(f"Unknown forest variant {variant!r}, expected one of {', '.join(FOREST_VARIANTS)}")
+    return FOREST_VARIANTS[variant](**kwargs)
@@ -0,0 +1,114 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from wildfire_conditions import seed_sequence, spawn_seeds
+from wildfire_core import make_forest
+
+
+def run_ensemble(number_of_scenarios, probability_of_rain, probability_of_lightning, highest_temperature,
+                 size_x=20, size_y=20, seed=None, workers=None, batch_size=64, variant="expert"):
+    # Every scenario has its own child seed, so the result does not depend on how the
+    # scenarios are split into batches or over worker processes. The terrain, which the expert
+    # forest draws on construction, comes from the ensemble seed too, so every worker builds the
+    # same one. It is taken from the seed's state, not a spawn, to leave the scenario seeds as they were.
+    seed = seed_sequence(seed)
+    scenario_seeds = spawn_seeds(seed, number_of_scenarios)
+    terrain_seed = int(seed.generate_state(1)[0])
+    conditions = dict(size_x=size_x,
+                      size_y=size_y,
+                      probability_of_rain=probability_of_rain,
+                      probability_of_lightning=probability_of_lightning,
+                      highest_temperature=highest_temperature)
+
+    if not workers or workers < 2:
+        burn_counts = np.zeros((size_x, size_y), dtype=np.int64)
+        burned_fractions = np.empty(number_of_scenarios)
+        run_scenarios(scenario_seeds, conditions, burn_counts, burned_fractions, batch_size, variant, terrain_seed)
+    else:
+        burn_counts, burned_fractions = run_ensemble_in_processes(scenario_seeds, conditions, workers, batch_size, variant, terrain_seed)
+
+    return summarize_ensemble(burn_counts, burned_fractions)
+
+
+def run_scenarios(scenario_seeds, conditions, burn_counts, burned_fractions, batch_size, variant="expert", terrain_seed=None):
+    # Built at the ensemble's size, so the terrain of an orographic forest already has the right shape.
+    forest = make_forest(variant, seed=terrain_seed, size_x=conditions["size_x"], size_y=conditions["size_y"])
+    for batch_start in range(0, len(scenario_seeds), batch_size):
+        batch_stop = min(batch_start + batch_size, len(scenario_seeds))
+        # Scenarios of a batch are stacked into one 3-D array and reduced together.
+        wildfires = np.empty((batch_stop - batch_start, conditions["size_x"], conditions["size_y"]), dtype=bool)
+        for scenario in range(batch_start, batch_stop):
+            wildfires[scenario - batch_start] = forest.construct_wildfire_matrix(seed=scenario_seeds[scenario], **conditions)
+        burn_counts += wildfires.sum(axis=0)
+        burned_fractions[batch_start:batch_stop] = wildfires.mean(axis=(1, 2))
+
+
+def run_ensemble_in_processes(scenario_seeds, conditions, workers, batch_size, variant="expert", terrain_seed=None):
+    number_of_scenarios = len(scenario_seeds)
+    counts_shape = (workers, conditions["size_x"], conditions["size_y"])
+    counts_memory = shared_memory.SharedMemory(create=True, size=int(np.prod(counts_shape)) * 8)
+    fractions_memory = shared_memory.SharedMemory(create=True, size=max(number_of_scenarios, 1) * 8)
+    try:
+        # Each worker accumulates into its own slice of the counts, so no locking is needed.
+        chunk_bounds = np.linspace(0, number_of_scenarios, workers + 1, dtype=int)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_ensemble_chunk,
+                                       counts_memory.name,
+                                       fractions_memory.name,
+                                       counts_shape,
+                                       number_of_scenarios,
+                                       worker,
+                                       scenario_seeds[chunk_bounds[worker]:chunk_bounds[worker + 1]],
+                                       int(chunk_bounds[worker]),
+                                       conditions,
+                                       batch_size,
+                                       variant,
+                                       terrain_seed)
+                       for worker in range(workers)]
+            for future in futures:
+                future.result()
+        burn_counts = np.ndarray(counts_shape, dtype=np.int64, buffer=counts_memory.buf).sum(axis=0)
+        burned_fractions = np.ndarray((number_of_scenarios,), dtype=np.float64, buffer=fractions_memory.buf).copy()
+    finally:
+        counts_memory.close()
+        counts_memory.unlink()
+        fractions_memory.close()
+        fractions_memory.unlink()
+    return burn_counts, burned_fractions
+
+
+def run_ensemble_chunk(counts_name, fractions_name, counts_shape, number_of_scenarios, worker,
+                       scenario_seeds, start, conditions, batch_size, variant="expert", terrain_seed=None):
+    counts_memory = shared_memory.SharedMemory(name=counts_name)
+    fractions_memory = shared_memory.SharedMemory(name=fractions_name)
+    try:
+        burn_counts = np.ndarray(counts_shape, dtype=np.int64, buffer=counts_memory.buf)
+        burned_fractions = np.ndarray((number_of_scenarios,), dtype=np.float64, buffer=fractions_memory.buf)
+        burn_counts[worker] = 0
+        run_scenarios(scenario_seeds,
+                      conditions,
+                      burn_counts[worker],
+                      burned_fractions[start:start + len(scenario_seeds)],
+                      batch_size,
+                      variant,
+                      terrain_seed)
+        del burn_counts, burned_fractions
+    finally:
+        counts_memory.close()
+        fractions_memory.close()
+
+
+def summarize_ensemble(burn_counts, burned_fractions):
+    number_of_scenarios = len(burned_fractions)
+    return {
+        "number_of_scenarios": number_of_scenarios,
+        "burn_counts": burn_counts,
+        "burn_frequency": burn_counts / max(number_of_scenarios, 1),
+        "burned_fractions": burned_fractions,
+        "mean_burned_fraction": float(np.mean(burned_fractions)) if number_of_scenarios else 0.0,
+        "std_burned_fraction": float(np.std(burned_fractions)) if number_of_scenarios else 0.0,
+        "min_burned_fraction": float(np.min(burned_fractions)) if number_of_scenarios else 0.0,
+        "max_burned_fraction": float(np.max(burned_fractions)) if number_of_scenarios else 0.0,
+    }
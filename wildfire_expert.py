@@ -7,93 +7,33 @@ from IPython.display import HTML, clear_output
 
 from random import choice, randint, uniform
 
+from wildfire_core import ExpertForest as Forest
+from wildfire_sprites import SpriteIndex, as_sprite_locations, update_sprite_cells
+from wildfire_scheduler import RenderScheduler
+from wildfire_sweep import ForestSweep
+from wildfire_widgets import close_widget, multi_rough_canvas
+
 
 global lightning
 global rain
 global temperature
 
-class Forest:
-    def __init__(self):
-        self.temperature = None
-        self.rain = None
-        self.lightning = None
-        self.wildfires = None
-        size_x = 20
-        size_y = 20
-        self.construct_wildfire_matrix(size_x, size_y, probability_of_rain=0.4, probability_of_lightning=0.2, highest_temperature=90)
-
-    def generate_specific_forest_conditions(self, size_of_x, size_of_y, probability_of_rain, probability_of_lightning, highest_temperature):
-        random_number_generator = np.random.default_rng()
-        lightning = random_number_generator.binomial(n=1, p=probability_of_lightning, size=(size_of_x, size_of_y))
-        rain = random_number_generator.binomial(n=1, p=probability_of_rain, size=(size_of_x, size_of_y))
-        rain[:,0:3] = 0
-        lowest_temperature_vector = random_number_generator.normal(0, 1, size=(size_of_x)) * 10
-        highest_temperature_vector = lowest_temperature_vector + highest_temperature - max(lowest_temperature_vector)
-        temperature = np.linspace(start=lowest_temperature_vector, stop=highest_temperature_vector, num=size_of_x, dtype=int)
-        for idx in range(len(temperature)):
-            temperature[idx] = np.convolve(temperature[idx], [0.25,0.25,0.25,0.25], mode='same')
-        temperature += highest_temperature - np.max(temperature)
-        temperature = np.flip(temperature).T
-        return lightning, rain, temperature
-        
-    def construct_annotation_matrix(self, lightning, rain, temperature):
-        annotations = np.empty_like(lightning, dtype='<U48')
-        for i in range(annotations.shape[0]):
-            for j in range(annotations.shape[1]):
-                raining_txt = "True" if rain[i][j] else "False"
-                lightning_txt = "True" if lightning[i][j] else "False"
-                annotations[i][j] = 'Rain: ' +  raining_txt +\
-                                    '<br>Temp: ' + str(temperature[i][j]) +\
-                                    '<br>Lightning: ' + lightning_txt
-        return annotations
-        
-    def construct_wildfire_matrix(self, size_x, size_y, probability_of_rain = 0.3, probability_of_lightning = 0.4, highest_temperature=85):
-        self.lightning, self.rain, self.temperature = self.generate_specific_forest_conditions(size_of_x=size_x,
-                                                                               size_of_y=size_y,
-                                                                               probability_of_rain=probability_of_rain,
-                                                                               probability_of_lightning=probability_of_lightning,
-                                                                               highest_temperature=highest_temperature)
-
-        def is_area_on_fire(x_coordinate, y_coordinate, lightning, rain, temperature):
-            if lightning[x_coordinate, y_coordinate] == True:
-                area_on_fire = True
-            elif temperature[x_coordinate, y_coordinate] > 55 and rain[x_coordinate, y_coordinate] == False:
-                area_on_fire = True
-            else:
-                area_on_fire = False
-            return area_on_fire
-        wildfires = np.empty_like(self.lightning)
-        for i in range(wildfires.shape[0]):
-            for j in range(wildfires.shape[1]):
-                wildfires[i][j] = is_area_on_fire(i, j, self.lightning, self.rain, self.temperature)
-        self.wildfires = wildfires
-        return wildfires
-
-    def predict_area_on_fire(self, x_coordinate, y_coordinate, lightning_value, temp_value, rain_value):
-        if bool(self.lightning[x_coordinate, y_coordinate]) == (lightning_value == "Yes"):
-            area_on_fire = True
-        elif self.temperature[x_coordinate, y_coordinate] > temp_value and bool(self.rain[x_coordinate, y_coordinate]) == (rain_value == "No"):
-            area_on_fire = True
-        else:
-            area_on_fire = False
-        return area_on_fire
-        
-    def is_lightning(self, x_coordinate, y_coordinate):
-        return bool(self.lightning[y_coordinate, x_coordinate])
-        
-    def is_rainshadow(self, x_coordinate, y_coordinate):
-        return bool(self.rain[y_coordinate, x_coordinate])
-
-    def is_raining(self, x_coordinate, y_coordinate):
-        return bool(self.rain[y_coordinate, x_coordinate])
-        
-    def get_temperature(self, x_coordinate, y_coordinate):
-        return self.temperature[y_coordinate, x_coordinate]
-
 class Drawer:
     def __init__(self, sprite_locations):
-        self.sprite_locations  = sprite_locations
-        self.canvas = Canvas(width=1500, height=1000//2, sync_image_data=True)
+        self.sprite_locations  = as_sprite_locations(sprite_locations)
+        self.sprite_index = SpriteIndex(self.sprite_locations, size=15, offset=50)
+        self.controls = None
+        self.mouse_handler = None
+        # The forest image, the fire overlay and the annotations are separate layers, so fires
+        # can be updated cell by cell without repainting the forest underneath.
+        self.layers = multi_rough_canvas(3, width=1500, height=1000//2)
+        self.background, self.overlay, self.canvas = self.layers[0], self.layers[1], self.layers[2]
+        self.background.sync_image_data = True
+        self.overlay_mask = None
+        self.overlay.fill_style = "#ff3636"
+        self.overlay.roughness = 0
+        self.overlay.line_width = 3.0
+        self.overlay.rough_fill_style = "solid"
         self.forest_image = Image.from_file("forestnofire.png")
 
     def draw_canvas(self,
@@ -109,31 +49,25 @@ class Drawer:
                     rain_shadow_input=None):
 
 
-        self.canvas.draw_image(self.forest_image)
-
-        with hold_canvas(self.canvas):
-            self.canvas.fill_style = "#ff3636"
-            self.canvas.roughness = 0
-            self.canvas.line_width = 4.0
-            self.canvas.rough_fill_style = "solid"
-
+        with hold_canvas():
+            self.background.draw_image(self.forest_image)
             if draw_predictions:
-                for i in range(predictions.shape[0]):
-                    for j in range(predictions.shape[1]):
-                        if predictions[i][j]:
-                            x, y, scale = self.sprite_locations[str([i, j])]
-                            self.canvas.scale(scale)
-                            #canvas.draw_image(fire_sprite, x, y, height=15, width=15)
-                            self.canvas.fill_rect(x+50, y+50, height=15*scale, width=15*scale)
+                self.overlay_mask = update_sprite_cells(self.overlay,
+                                                        self.sprite_locations,
+                                                        self.overlay_mask,
+                                                        predictions,
+                                                        size=15,
+                                                        offset=50)
 
 
         out = Output()
         @out.capture()
         def handle_mouse_down(x, y):
+            cell = self.sprite_index.cell_at(x, y)
             x = x-50
             y = y-50
-            coord_x = int(size_x*(x-100)/canvas_size_x)
-            coord_y = int(size_y*y/canvas_size_y)
+            # Clicks between sprites fall back to the cell of the grid square under the cursor.
+            coord_x, coord_y = cell if cell is not None else (int(size_x*(x-100)/canvas_size_x), int(size_y*y/canvas_size_y))
             if coord_x > size_x-1 or coord_y > size_y-1 or coord_x < 0 or coord_y < 0:
                 return
             annotation = f'The selected area ({coord_x}, {coord_y}) is '
@@ -143,7 +77,7 @@ class Drawer:
             else:
                 annotation += "not burning."
             annotation += f'The temperature is {forest.get_temperature(coord_x, coord_y)}°F.It is '
-            if forest.is_rainshadow(coord_x, coord_y):
+            if forest.is_raining(coord_x, coord_y):
                 annotation += 'raining in this area.There are '
             else:
                 annotation += 'not raining in this area.There are '
@@ -151,7 +85,7 @@ class Drawer:
                 annotation += 'lightning strikes in the area.'
             else:
                 annotation += 'no lightning strikes in the area.'
-            with hold_canvas(self.canvas):
+            with hold_canvas():
                 self.canvas.restore()
                 self.canvas.clear_rect(x=50+1100//2, y=0+50, width=800, height=2000//2)
                 canvas_width = 1500
@@ -170,19 +104,62 @@ class Drawer:
                 self.canvas.fill_text(split_annotations[2], 50+1500//2, center_align+10)
                 self.canvas.fill_text(split_annotations[3], 50+1500//2, center_align+30)
 
-        self.canvas.on_mouse_down(handle_mouse_down)
-        return self.canvas
+        # Only the handler of the latest forest stays registered.
+        if self.mouse_handler is not None:
+            self.layers.on_mouse_down(self.mouse_handler, remove=True)
+        self.mouse_handler = handle_mouse_down
+        self.layers.on_mouse_down(handle_mouse_down)
+        return self.layers
+
+    def draw_fires(self, forest, redraw=False):
+        # Sprite locations are indexed [x, y] while wildfires is indexed [y, x].
+        with hold_canvas():
+            if redraw:
+                self.background.draw_image(self.forest_image)
+            self.overlay_mask = update_sprite_cells(self.overlay,
+                                                    self.sprite_locations,
+                                                    None if redraw else self.overlay_mask,
+                                                    forest.wildfires.T,
+                                                    size=15,
+                                                    offset=50)
 
     def clr_canvas(self):
-        self.canvas.clear()
-        self.canvas.fill_style = '#FFFFFF'
-        self.canvas.fill_rect(0, 0, width=1500, height=1000//2)
+        self.layers.clear()
+        self.overlay_mask = None
+        self.background.fill_style = '#FFFFFF'
+        self.background.fill_rect(0, 0, width=1500, height=1000//2)
 
 
     def draw_canvas_with_controls(self, forest, canvas_size_x = 800//2, canvas_size_y = 800//2, size_x = 20, size_y = 20,
                                   temperature_value=0, lightning_value=0, rain_shadow_value=0):
-        grid = GridspecLayout(20, 10)
-        temperature_input = widgets.IntSlider(min=40,
+        # The controls are built once per forest and reused, showing them again does not create new widgets.
+        if self.controls is None or self.controls.forest is not forest:
+            if self.controls is not None:
+                self.controls.close()
+            self.controls = ForestControls(self,
+                                           forest,
+                                           canvas_size_x=canvas_size_x,
+                                           canvas_size_y=canvas_size_y,
+                                           size_x=size_x,
+                                           size_y=size_y,
+                                           temperature_value=temperature_value,
+                                           lightning_value=lightning_value,
+                                           rain_shadow_value=rain_shadow_value)
+        display(self.controls.grid)
+        return self.controls
+
+
+class ForestControls:
+    def __init__(self, drawer, forest, canvas_size_x = 800//2, canvas_size_y = 800//2, size_x = 20, size_y = 20,
+                 temperature_value=0, lightning_value=0, rain_shadow_value=0):
+        self.drawer = drawer
+        self.forest = forest
+        self.size_x = size_x
+        self.size_y = size_y
+        self.sweep = ForestSweep(forest, size_x=size_x, size_y=size_y)
+        self.scheduler = RenderScheduler(delay=0.1)
+
+        self.temperature_input = widgets.IntSlider(min=40,
                                       max=150,
                                       #description="Probability of Lightning Strike" ,
                                       disabled=False,
@@ -192,7 +169,7 @@ class Drawer:
                                       value=temperature_value,
                                       #style={"handle_color": color[i]},
                                       layout=widgets.Layout(width='200px'))
-        lightning_input = widgets.FloatSlider(min=0,
+        self.lightning_input = widgets.FloatSlider(min=0,
                                       max=100,
                                       #description="Probability of Lightning Strike" ,
                                       disabled=False,
@@ -203,7 +180,7 @@ class Drawer:
                                       #style={"handle_color": color[i]},
                                       layout=widgets.Layout(width='200px'))
         
-        rain_shadow_input = widgets.FloatSlider(min=0,
+        self.rain_shadow_input = widgets.FloatSlider(min=0,
                                       max=100,
                                       #description="Probability of Lightning Strike" ,
                                       disabled=False,
@@ -213,74 +190,76 @@ class Drawer:
                                       value=rain_shadow_value,
                                       #style={"handle_color": color[i]},
                                       layout=widgets.Layout(width='200px'))
+        self.button = widgets.Button(description="Press to Refresh!")
 
-
-        forest.construct_wildfire_matrix(size_x=20,
-                                         size_y=20,
-                                         probability_of_rain=rain_shadow_input.value/100, 
-                                         probability_of_lightning=lightning_input.value/100,
-                                         highest_temperature=temperature_input.value)
-
-        self.draw_canvas(forest,
-                          canvas_size_x=canvas_size_x,
-                          canvas_size_y=canvas_size_y,
-                          size_x=20,
-                          size_y=20,
-                          draw_predictions=True,
-                          predictions=forest.wildfires,
-                          lightning_input=lightning_input,
-                          temperature_input=temperature_input,
-                          rain_shadow_input=rain_shadow_input)
-
-        grid[6:, 1:6] = self.canvas
-
-        grid[1,1:7] = widgets.HBox(
+        self.grid = GridspecLayout(20, 10)
+        self.grid[1,1:7] = widgets.HBox(
                 [widgets.HTML("<h1>Adjust the conditions of the forest below:</h1>", style={"text_color":"black", "font_weight":"bold", "font_size":"50px"})
                 ], layout=widgets.Layout(align_items="center", justify_content="space-between"))
 
-        grid[2,1:8] = widgets.HBox(
+        self.grid[2,1:8] = widgets.HBox(
             [widgets.HTML("<h3>Chance of Lightning Strikes occuring (%): </h3>", style={"text_color":"black", "font_weight":"bold", "font_size":"20px"}),
-                 lightning_input
+                 self.lightning_input
                 ], layout=widgets.Layout(align_items="center", justify_content="space-between"))
 
-
-        grid[3,1:8] = widgets.HBox(
+        self.grid[3,1:8] = widgets.HBox(
                 [widgets.HTML("<h3>Chance of Rainfall (%): </h3>", style={"text_color":"black", "font_weight":"bold", "font_size":"20px"}),
-                 rain_shadow_input,
+                 self.rain_shadow_input,
                 ], layout=widgets.Layout(align_items="center", justify_content="space-between"))
 
-        grid[4,1:8] = widgets.HBox(
+        self.grid[4,1:8] = widgets.HBox(
                 [widgets.HTML("<h3>Temperature of Hottest Area (F): </h3>", style={"text_color":"black", "font_weight":"bold", "font_size":"20px"}),
-                 temperature_input
+                 self.temperature_input
                 ], layout=widgets.Layout(align_items="center", justify_content="space-between"))
-
-
-        button = widgets.Button(description="Press to Refresh!")
-        def on_button_clicked(b):
-            clear_output(wait=True)
-            self.clr_canvas()
-
-            self.draw_canvas_with_controls(forest,
-                                           temperature_value=temperature_input.value,
-                                           lightning_value=lightning_input.value,
-                                           rain_shadow_value=rain_shadow_input.value)
-
-        button.on_click(on_button_clicked)
-        grid[5,1:4] = button
-        display(grid)
-        # redraw everything because it doesn't always work when drawing only once :((
-        with hold_canvas(self.canvas):
-          self.canvas.draw_image(self.forest_image)
-          self.canvas.fill_style = "#ff3636"
-          self.canvas.roughness = 0
-          self.canvas.line_width = 3.0
-          self.canvas.rough_fill_style = "solid"
-
-          for i in range(forest.wildfires.shape[0]):
-              for j in range(forest.wildfires.shape[1]):
-                  if forest.wildfires[j][i]:
-                      x, y, scale = self.sprite_locations[str([i, j])]
-                      x += 50
-                      y += 50
-                      self.canvas.scale(scale)
-                      self.canvas.fill_rect(x, y, height=15*scale, width=15*scale)
+        self.grid[5,1:4] = self.button
+
+        self.sweep.apply(lightning_value=self.lightning_input.value,
+                         rain_value=self.rain_shadow_input.value,
+                         temperature_value=self.temperature_input.value)
+        self.grid[6:, 1:6] = drawer.draw_canvas(forest,
+                                                canvas_size_x=canvas_size_x,
+                                                canvas_size_y=canvas_size_y,
+                                                size_x=size_x,
+                                                size_y=size_y)
+        drawer.draw_fires(forest, redraw=True)
+
+        for control in (self.lightning_input, self.rain_shadow_input, self.temperature_input):
+            control.observe(self.on_value_change, names='value')
+        self.button.on_click(self.on_button_clicked)
+        # Frontends that connect after the first draw start from an empty canvas, so they get a full redraw.
+        drawer.layers.on_client_ready(self.on_client_ready)
+
+    def on_value_change(self, change):
+        self.scheduler.request(self.render)
+
+    def render(self, is_stale):
+        values = dict(lightning_value=self.lightning_input.value,
+                      rain_value=self.rain_shadow_input.value,
+                      temperature_value=self.temperature_input.value)
+        # Constructing the forest fills the sweep cache, a newer slider value skips drawing this one.
+        self.sweep.scenario(**values)
+        if is_stale():
+            return
+        self.sweep.apply(**values)
+        self.drawer.draw_fires(self.forest)
+
+    def on_button_clicked(self, button):
+        # A refresh draws a new forest for the same conditions.
+        self.sweep = ForestSweep(self.forest, size_x=self.size_x, size_y=self.size_y, seed=self.forest.seed_sequence.spawn(1)[0])
+        self.on_value_change(None)
+
+    def on_client_ready(self):
+        self.drawer.draw_fires(self.forest, redraw=True)
+
+    def close(self):
+        self.scheduler.cancel()
+        for control in (self.lightning_input, self.rain_shadow_input, self.temperature_input):
+            control.unobserve(self.on_value_change, names='value')
+        self.button.on_click(self.on_button_clicked, remove=True)
+        self.drawer.layers.on_client_ready(self.on_client_ready, remove=True)
+        for child in self.grid.children:
+            if child is not self.drawer.layers:
+                for widget in getattr(child, "children", ()):
+                    close_widget(widget)
+                close_widget(child)
+        close_widget(self.grid)
@@ -0,0 +1,151 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from wildfire_annotations import selected_area_annotation
+from wildfire_conditions import seed_sequence, spawn_seeds
+from wildfire_core import make_forest
+from wildfire_sprites import mountain_layout, random_sprite_layout
+
+
+# Renders the scene of wildfire_src.Drawer.draw_canvas into an RGBA numpy buffer with PIL, so
+# frames can be produced without a notebook frontend. Positions, sizes and seeds follow the Drawer.
+SPRITE_PATHS = {"tree": "sprites/tree1.png", "fire": "sprites/fire.png", "mountain": "sprites/mountain.png"}
+SPRITE_SIZE = 20
+OFFSET = 100
+WIDTH = 2000
+HEIGHT = 1000
+OVERLAY_COLOR = (0xff, 0x36, 0x36, 0xff)
+
+
+def drawer_seeds(seed=None):
+    # Same terrain and layout seeds as wildfire_src.Drawer(forest, seed).
+    terrain_seed, layout_seed = (int(state) for state in seed_sequence(seed).generate_state(2))
+    return terrain_seed, layout_seed
+
+
+@lru_cache(maxsize=None)
+def load_sprite(name):
+    return Image.open(SPRITE_PATHS[name]).convert("RGBA")
+
+
+@lru_cache(maxsize=1024)
+def scaled_sprite(name, width):
+    # Sprites are stretched to a square like the 20x20 sprite canvases of the Drawer.
+    return load_sprite(name).resize((width, width), Image.LANCZOS)
+
+
+@lru_cache(maxsize=8)
+def render_terrain(terrain_seed, width=WIDTH, height=HEIGHT):
+    # The rough.js hatch fills of the notebook become two flat greens with a diagonal hatch.
+    image = Image.new("RGBA", (width, height), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
+    left, top, right, bottom = OFFSET, OFFSET, OFFSET + 1000, OFFSET + 800
+    draw.rectangle((left, top, right - 1, bottom - 1), fill="#93cc5e")
+    for start in range(left - (bottom - top), right, 8):
+        draw.line((start, bottom, start + (bottom - top), top), fill="#6A9F3A", width=3)
+
+    for pos_x, pos_y, scale in mountain_layout(terrain_seed):
+        paste_sprite(image, "mountain", OFFSET + pos_x, OFFSET + pos_y, scale)
+    terrain = np.array(image)
+    terrain.flags.writeable = False
+    return terrain
+
+
+def paste_sprite(image, name, x, y, scale):
+    width = max(int(round(SPRITE_SIZE * scale)), 1)
+    image.alpha_composite(scaled_sprite(name, width), dest=(int(round(x)), int(round(y))))
+
+
+def fill_cells(frame, sprite_locations, mask, color=OVERLAY_COLOR):
+    # Same rectangles as fill_sprite_cells with the Drawer's size and offset.
+    for x, y, scale in sprite_locations[np.asarray(mask, dtype=bool)]:
+        left, top = int(round(x + OFFSET)), int(round(y + OFFSET))
+        extent = int(round(SPRITE_SIZE * scale))
+        frame[max(top, 0):top + extent, max(left, 0):left + extent] = color
+
+
+def draw_annotation(image, lines):
+    draw = ImageDraw.Draw(image)
+    center_align = OFFSET + 400
+    arrow_x = OFFSET + 1400
+    draw.line((OFFSET + 1101, center_align, arrow_x, center_align), fill="black")
+    draw.line((arrow_x - 10, center_align + 10, arrow_x, center_align), fill="black")
+    draw.line((arrow_x - 10, center_align - 10, arrow_x, center_align), fill="black")
+    font = ImageFont.load_default(size=18)
+    for line_number, line in enumerate(lines):
+        draw.text((OFFSET + 1500, center_align - 10 * (len(lines) - 1) + 20 * line_number), line, fill="black", font=font, anchor="ls")
+
+
+def render_forest(forest, seed=None, size_x=30, size_y=30, canvas_size_x=800, canvas_size_y=800,
+                  predictions=None, selected=None):
+    # predictions is a mask over the sprite cells, indexed [x, y] like the sprite locations, and
+    # selected the (x, y) cell whose annotation is shown as if it had been clicked.
+    terrain_seed, layout_seed = drawer_seeds(seed)
+    sprite_locations = random_sprite_layout(layout_seed, canvas_size_x, canvas_size_y, size_x, size_y)
+    image = Image.fromarray(render_terrain(terrain_seed))
+    for x in range(size_x):
+        for y in range(size_y):
+            sprite = "fire" if forest.wildfires[y, x] else "tree"
+            pos_x, pos_y, scale = sprite_locations[x, y]
+            paste_sprite(image, sprite, OFFSET + pos_x, OFFSET + pos_y, scale)
+
+    if selected is None:
+        lines = ["Click on the forest to view details here"]
+    else:
+        lines = selected_area_annotation(forest, *selected)
+    draw_annotation(image, lines)
+
+    frame = np.array(image)
+    if predictions is not None:
+        fill_cells(frame, sprite_locations, predictions)
+    return frame
+
+
+def encode_png(frame, compress_level=1):
+    # Encoding dominates the frame time, the lowest zlib level is about twice as fast as the default.
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(buffer, format="PNG", compress_level=compress_level)
+    return buffer.getvalue()
+
+
+def save_png(frame, path, compress_level=1):
+    Image.fromarray(frame).save(path, format="PNG", compress_level=compress_level)
+
+
+def render_scenario(path, conditions, scenario_seed, seed=None, size_x=30, size_y=30, prediction_values=None, variant="src",
+                    terrain_seed=None):
+    # prediction_values are the (lightning, temperature, rain) inputs of Forest.predict_grid.
+    # terrain_seed seeds the forest, which for orographic variants draws its elevation on construction.
+    forest = make_forest(variant, seed=terrain_seed, size_x=size_x, size_y=size_y)
+    forest.construct_wildfire_matrix(size_x=size_x, size_y=size_y, seed=scenario_seed, **conditions)
+    predictions = None
+    if prediction_values is not None:
+        # The Drawer overlays the cells where the prediction and the actual fires disagree.
+        _, predictions, _ = forest.predict_grid(*prediction_values)
+    save_png(render_forest(forest, seed=seed, size_x=size_x, size_y=size_y, predictions=predictions), path)
+    return path
+
+
+def render_batch(scenarios, directory, seed=None, workers=None, size_x=30, size_y=30, prediction_values=None, variant="src"):
+    # scenarios is a list of construct_wildfire_matrix keyword arguments, every one rendered to
+    # its own PNG file. Each scenario has its own child seed, so the frames do not depend on workers.
+    os.makedirs(directory, exist_ok=True)
+    # Resolved once so every frame is drawn on the same terrain and layout, also when seed is None.
+    seed = seed_sequence(seed)
+    scenario_seeds = spawn_seeds(seed, len(scenarios))
+    # The first two words of the seed's state are the Drawer's terrain and layout seeds, the third
+    # gives every frame and worker the same forest terrain without changing the scenario seeds.
+    terrain_seed = int(seed.generate_state(3)[2])
+    paths = [os.path.join(directory, f"scenario_{number:05d}.png") for number in range(len(scenarios))]
+    arguments = [(path, conditions, scenario_seed, seed, size_x, size_y, prediction_values, variant, terrain_seed)
+                 for path, conditions, scenario_seed in zip(paths, scenarios, scenario_seeds)]
+
+    if not workers or workers < 2:
+        return [render_scenario(*scenario_arguments) for scenario_arguments in arguments]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render_scenario, *zip(*arguments), chunksize=max(1, len(arguments) // (4 * workers))))
@@ -0,0 +1,142 @@
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from wildfire_conditions import TEMPERATURE_DTYPE
+
+
+# A raw raster is a JSON header line such as {"shape": [4000, 6000], "dtype": "<f4"} followed by the
+# values in C order, so it can be memory mapped from the byte after the header.
+RAW_EXTENSIONS = (".raw", ".bin")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+RESAMPLING_METHODS = ("nearest", "mean")
+
+
+def save_raw(path, values):
+    values = np.ascontiguousarray(values)
+    header = json.dumps({"shape": list(values.shape), "dtype": values.dtype.str}).encode("ascii") + b"\n"
+    with open(path, "wb") as raw_file:
+        raw_file.write(header)
+        raw_file.write(values.tobytes())
+
+
+def open_raw(path):
+    with open(path, "rb") as raw_file:
+        header_line = raw_file.readline()
+    header = json.loads(header_line)
+    return np.memmap(path, dtype=np.dtype(header["dtype"]), mode="r", offset=len(header_line), shape=tuple(header["shape"]))
+
+
+def open_raster(source):
+    # Arrays and memory maps are returned as they are, slicing them only reads the rows of a
+    # window. Images can not be read in parts, they are decoded once and then windowed.
+    if not isinstance(source, (str, os.PathLike)):
+        return np.asarray(source)
+    extension = os.path.splitext(os.fspath(source))[1].lower()
+    if extension == ".npy":
+        return np.load(source, mmap_mode="r")
+    if extension in RAW_EXTENSIONS:
+        return open_raw(source)
+    if extension in IMAGE_EXTENSIONS:
+        with Image.open(source) as image:
+            return np.asarray(image.convert("L"))
+    raise ValueError(f"Unsupported raster format {extension!r} of {source}")
+
+
+def read_window(source, window=None):
+    # window is a (rows, columns) pair of slices in the pixels of the source, None reads everything.
+    raster = open_raster(source)
+    if raster.ndim != 2:
+        raise ValueError(f"Expected a single band raster, got shape {raster.shape}")
+    if window is None:
+        window = (slice(None), slice(None))
+    rows, columns = window
+    return raster[rows, columns]
+
+
+def bin_edges(source_size, target_size):
+    # Start of the block of source cells that falls into each target cell.
+    return (np.arange(target_size) * source_size) // target_size
+
+
+def resample(values, shape, method="nearest", chunk_rows=1024):
+    # Resamples a window to the simulation grid, chunk_rows target rows at a time so only the
+    # source rows of one chunk are read from a memory mapped raster at once.
+    if method not in RESAMPLING_METHODS:
+        raise ValueError(f"Unknown resampling method {method!r}, expected one of {', '.join(RESAMPLING_METHODS)}")
+    source_rows, source_columns = values.shape
+    target_rows, target_columns = shape
+    if source_rows < target_rows or source_columns < target_columns:
+        method = "nearest"
+    output_dtype = np.float64 if method == "mean" else values.dtype
+    resampled = np.empty(shape, dtype=output_dtype)
+
+    if method == "nearest":
+        # Centre of every target cell mapped into the source grid.
+        row_index = ((np.arange(target_rows) + 0.5) * source_rows / target_rows).astype(np.intp)
+        column_index = ((np.arange(target_columns) + 0.5) * source_columns / target_columns).astype(np.intp)
+        for start in range(0, target_rows, chunk_rows):
+            stop = min(start + chunk_rows, target_rows)
+            resampled[start:stop] = np.asarray(values[row_index[start:stop]])[:, column_index]
+        return resampled
+
+    row_edges = bin_edges(source_rows, target_rows)
+    column_edges = bin_edges(source_columns, target_columns)
+    column_counts = np.diff(np.append(column_edges, source_columns))
+    row_counts = np.diff(np.append(row_edges, source_rows))
+    for start in range(0, target_rows, chunk_rows):
+        stop = min(start + chunk_rows, target_rows)
+        first_row = row_edges[start]
+        last_row = row_edges[stop] if stop < target_rows else source_rows
+        block = np.asarray(values[first_row:last_row], dtype=np.float64)
+        sums = np.add.reduceat(block, row_edges[start:stop] - first_row, axis=0)
+        sums = np.add.reduceat(sums, column_edges, axis=1)
+        resampled[start:stop] = sums / (row_counts[start:stop, None] * column_counts[None, :])
+    return resampled
+
+
+def read_layer(source, shape=None, window=None, method="nearest", chunk_rows=1024):
+    values = read_window(source, window)
+    if shape is None or tuple(shape) == values.shape:
+        return np.array(values)
+    return resample(values, shape, method=method, chunk_rows=chunk_rows)
+
+
+def mask_scale(values):
+    # Value of a set cell in a mask source, 255 for 0..255 image pixels and 1 for bools and 0/1 values.
+    values = np.asarray(values)
+    return 255 if values.dtype == np.uint8 and values.max(initial=0) > 1 else 1
+
+
+def as_mask(values, scale=1):
+    # Thresholds a mask or its block means halfway, scale is the mask_scale of the source the values
+    # were resampled from, a mean resampled 0..255 image is still on the 0..255 scale.
+    values = np.asarray(values)
+    if values.dtype == bool:
+        return values
+    return values > 0.5 * scale
+
+
+def load_condition_layers(lightning=None, rain=None, temperature=None, elevation=None, shape=None, window=None,
+                          method="nearest", chunk_rows=1024):
+    # Reads the given layers from arrays or raster files, cut to the same window and resampled to
+    # shape, in the dtypes Forest keeps its layers in.
+    layers = {}
+    for name, source in (("lightning", lightning), ("rain", rain), ("temperature", temperature), ("elevation", elevation)):
+        if source is None:
+            continue
+        raster = read_window(source, window)
+        values = read_layer(raster, shape=shape, method=method, chunk_rows=chunk_rows)
+        if name in ("lightning", "rain"):
+            layers[name] = as_mask(values, scale=mask_scale(raster))
+        elif name == "temperature":
+            layers[name] = np.round(values).astype(TEMPERATURE_DTYPE)
+        else:
+            layers[name] = values.astype(np.float32)
+
+    shapes = {name: values.shape for name, values in layers.items()}
+    if len(set(shapes.values())) > 1:
+        raise ValueError(f"Condition layers have different shapes: {shapes}, pass shape to resample them to one grid")
+    return layers
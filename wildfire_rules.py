@@ -0,0 +1,105 @@
+import json
+from functools import lru_cache
+
+import numpy as np
+
+
+OPERATORS = {
+    "==": np.equal,
+    "!=": np.not_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+}
+
+# An area is on fire as soon as one of the rules holds. A rule holds when all of its
+# conditions hold, and a condition is a (layer, operator, value) triple comparing one of
+# the named forest condition layers against a constant.
+WILDFIRE_RULES = (
+    (("lightning", "==", True),),
+    (("temperature", ">", 55), ("rain", "==", False)),
+)
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = normalize_rules(rules)
+        self.layers = sorted({layer for conditions in self.rules for layer, _, _ in conditions})
+        self.compiled_rules = []
+        for conditions in self.rules:
+            compiled_conditions = []
+            for layer, comparison, value in conditions:
+                if comparison not in OPERATORS:
+                    raise ValueError(f"Unknown operator {comparison!r} in condition on {layer!r}")
+                compiled_conditions.append((layer, OPERATORS[comparison], value))
+            self.compiled_rules.append(compiled_conditions)
+
+    def evaluate(self, layers, index=None):
+        missing_layers = [layer for layer in self.layers if layer not in layers]
+        if missing_layers:
+            raise ValueError(f"Missing condition layers: {', '.join(missing_layers)}")
+
+        area_on_fire = False
+        for conditions in self.compiled_rules:
+            rule_holds = True
+            for layer, comparison, value in conditions:
+                layer_values = layers[layer] if index is None else layers[layer][index]
+                rule_holds = np.logical_and(rule_holds, comparison(layer_values, value))
+            area_on_fire = np.logical_or(area_on_fire, rule_holds)
+        return area_on_fire
+
+    def __call__(self, layers, index=None):
+        return self.evaluate(layers, index=index)
+
+    def __repr__(self):
+        return f"RuleSet({self.rules!r})"
+
+
+def normalize_rules(rules):
+    normalized_rules = []
+    for conditions in rules:
+        normalized_conditions = []
+        for condition in conditions:
+            if len(condition) != 3:
+                raise ValueError(f"A condition must be a (layer, operator, value) triple, got {condition!r}")
+            layer, comparison, value = condition
+            normalized_conditions.append((str(layer), str(comparison), value))
+        normalized_rules.append(tuple(normalized_conditions))
+    return tuple(normalized_rules)
+
+
+def compile_rules(rules):
+    if isinstance(rules, RuleSet):
+        return rules
+    return compile_normalized_rules(normalize_rules(rules))
+
+
+@lru_cache(maxsize=256)
+def compile_normalized_rules(rules):
+    return RuleSet(rules)
+
+
+def load_rules(path):
+    # Rules are stored as JSON, e.g. [[["lightning", "==", true]], [["temperature", ">", 55], ["rain", "==", false]]]
+    with open(path) as rules_file:
+        return normalize_rules(json.load(rules_file))
+
+
+def score_predictions(predictions, wildfires):
+    predictions = np.asarray(predictions, dtype=bool)
+    wildfires = np.asarray(wildfires, dtype=bool)
+    true_positives = int(np.count_nonzero(predictions & wildfires))
+    false_positives = int(np.count_nonzero(predictions & ~wildfires))
+    false_negatives = int(np.count_nonzero(~predictions & wildfires))
+    true_negatives = predictions.size - true_positives - false_positives - false_negatives
+    predicted_fires = true_positives + false_positives
+    actual_fires = true_positives + false_negatives
+    return {
+        "true_positives": true_positives,
+        "false_positives": false_positives,
+        "false_negatives": false_negatives,
+        "true_negatives": true_negatives,
+        "precision": true_positives / predicted_fires if predicted_fires else 0.0,
+        "recall": true_positives / actual_fires if actual_fires else 0.0,
+    }
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+
+class RenderScheduler:
+    def __init__(self, delay=0.1):
+        # Requests that arrive within delay seconds of each other are coalesced, only the newest
+        # one is rendered. Every request bumps the generation, so a render that is still running
+        # when a newer request comes in can see that it is stale and skip drawing.
+        self.delay = delay
+        self.generation = 0
+        self.callback = None
+        self.pending = None
+        self.lock = threading.Lock()
+        self.render_lock = threading.Lock()
+        self.requested = 0
+        self.rendered = 0
+
+    def request(self, callback):
+        with self.lock:
+            self.generation += 1
+            self.requested += 1
+            self.callback = callback
+            if self.pending is not None:
+                self.pending.cancel()
+            self.pending = self.schedule(self.generation)
+
+    def schedule(self, generation):
+        # Inside the kernel the observers run on its asyncio loop, anywhere else a timer thread is used.
+        # Either way the render runs off the loop, which keeps handling the slider messages that
+        # make a running render stale.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            return loop.call_later(self.delay, loop.run_in_executor, None, self.run, generation)
+        timer = threading.Timer(self.delay, self.run, args=(generation,))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def run(self, generation):
+        with self.lock:
+            if generation != self.generation or self.callback is None:
+                return
+            callback = self.callback
+            self.callback = None
+            self.pending = None
+        with self.render_lock:
+            if self.is_stale(generation):
+                return
+            self.rendered += 1
+            callback(lambda: self.is_stale(generation))
+
+    def is_stale(self, generation):
+        return generation != self.generation
+
+    def flush(self):
+        # Renders the newest request right away instead of waiting for the delay.
+        with self.lock:
+            if self.pending is not None:
+                self.pending.cancel()
+            generation = self.generation
+        self.run(generation)
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            self.callback = None
+            if self.pending is not None:
+                self.pending.cancel()
+                self.pending = None
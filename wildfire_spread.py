@@ -0,0 +1,237 @@
+import numpy as np
+
+
+UNBURNT, BURNING, BURNT = 0, 1, 2
+
+# (dy, dx) offsets of the cells a burning cell spreads to, on grids indexed [y, x] like Forest.wildfires.
+NEIGHBOURHOODS = {
+    "von_neumann": ((-1, 0), (0, -1), (0, 1), (1, 0)),
+    "moore": ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)),
+}
+
+
+def neighbourhood_offsets(neighbourhood):
+    if isinstance(neighbourhood, str):
+        if neighbourhood not in NEIGHBOURHOODS:
+            raise ValueError(f"Unknown neighbourhood {neighbourhood!r}, expected one of {', '.join(NEIGHBOURHOODS)} or a sequence of (dy, dx) offsets")
+        return NEIGHBOURHOODS[neighbourhood]
+    offsets = tuple((int(dy), int(dx)) for dy, dx in neighbourhood)
+    if (0, 0) in offsets:
+        raise ValueError("A neighbourhood can not contain the (0, 0) offset")
+    return offsets
+
+
+def shifted_slices(offset, shape):
+    # Slices so that destination[dst] lines up with source[src] moved by offset, cells moved
+    # past the border are dropped.
+    dst = []
+    src = []
+    for delta, size in zip(offset, shape):
+        if delta >= 0:
+            dst.append(slice(delta, size))
+            src.append(slice(0, size - delta))
+        else:
+            dst.append(slice(0, size + delta))
+            src.append(slice(-delta, size))
+    return tuple(dst), tuple(src)
+
+
+def directional_spread_probabilities(shape, neighbourhood="moore", base_probability=0.6, wind=None, elevation=None,
+                                     wind_strength=0.1, slope_strength=0.078, cell_size=30.0):
+    # Probability that a burning cell ignites each of its neighbours, as a (K, size_y, size_x)
+    # tensor with one layer per neighbourhood offset, computed once per scenario so a spread step
+    # only has to look the probabilities up.
+    #   wind is (wind_x, wind_y) or a (2, size_y, size_x) field, x pointing east and y south. Fire
+    #   spreads faster downwind, by exp(wind_strength * wind speed along the spread direction).
+    #   elevation in the units of cell_size makes fire run uphill, by exp(slope_strength * slope
+    #   angle in degrees).
+    offsets = neighbourhood_offsets(neighbourhood)
+    probabilities = np.zeros((len(offsets),) + tuple(shape), dtype=np.float32)
+    if wind is not None:
+        wind = np.asarray(wind, dtype=np.float32)
+        if wind.ndim == 1:
+            wind = wind[:, None, None]
+    if elevation is not None:
+        elevation = np.asarray(elevation, dtype=np.float32)
+
+    for k, offset in enumerate(offsets):
+        dy, dx = offset
+        distance = np.hypot(dy, dx)
+        # A burning cell at [src] spreads to the cell at [dst], border cells have no neighbour there.
+        dst, src = shifted_slices(offset, shape)
+        factor = np.full(probabilities[k][src].shape, base_probability, dtype=np.float32)
+        if wind is not None:
+            wind_along = (np.broadcast_to(wind[0], shape)[src] * dx + np.broadcast_to(wind[1], shape)[src] * dy) / distance
+            factor *= np.exp(wind_strength * wind_along)
+        if elevation is not None:
+            slope = np.degrees(np.arctan((elevation[dst] - elevation[src]) / (distance * cell_size)))
+            factor *= np.exp(slope_strength * slope)
+        probabilities[k][src] = np.minimum(factor, 1)
+    return probabilities
+
+
+def forest_spread_probabilities(forest, neighbourhood="moore", base_probability=0.6, wind=None, **kwargs):
+    elevation = forest.elevation if forest.elevation is not None else forest.construct_elevation()
+    return directional_spread_probabilities(forest.wildfires.shape,
+                                            neighbourhood=neighbourhood,
+                                            base_probability=base_probability,
+                                            wind=wind,
+                                            elevation=elevation,
+                                            **kwargs)
+
+
+class FireSpread:
+    def __init__(self, ignition, fuel=None, neighbourhood="moore", burn_duration=1, spread_probability=1.0, seed=None):
+        # Cells in ignition start burning, a burning cell ignites the unburnt cells with fuel in its
+        # neighbourhood, each with spread_probability, and burns out after burn_duration steps.
+        # spread_probability is a number or a per direction tensor from directional_spread_probabilities.
+        ignition = np.asarray(ignition, dtype=bool)
+        if not 1 <= burn_duration <= np.iinfo(np.int16).max:
+            raise ValueError(f"burn_duration must be between 1 and {np.iinfo(np.int16).max}, got {burn_duration}")
+        self.shape = ignition.shape
+        self.offsets = neighbourhood_offsets(neighbourhood)
+        self.radius = max((max(abs(dy), abs(dx)) for dy, dx in self.offsets), default=0)
+        self.burn_duration = burn_duration
+        # np.asarray keeps a number 0-d, np.ascontiguousarray would turn it into a (1,) array.
+        self.spread_probability = np.asarray(spread_probability, dtype=np.float32)
+        if self.spread_probability.ndim:
+            self.spread_probability = np.ascontiguousarray(self.spread_probability)
+        if self.spread_probability.ndim and self.spread_probability.shape != (len(self.offsets),) + self.shape:
+            raise ValueError(f"spread_probability must be a number or have shape {(len(self.offsets),) + self.shape}, got {self.spread_probability.shape}")
+        self.directional = self.spread_probability.ndim > 0
+        self.certain = not self.directional and self.spread_probability >= 1
+        self.random_number_generator = np.random.default_rng(seed)
+        self.fuel = np.ones(self.shape, dtype=bool) if fuel is None else np.ascontiguousarray(fuel, dtype=bool)
+
+        self.state = np.full(self.shape, UNBURNT, dtype=np.uint8)
+        self.state[ignition] = BURNING
+        self.burn_time = np.zeros(self.shape, dtype=np.int16)
+        self.burn_time[ignition] = burn_duration
+        # Work buffers are allocated once and reused by every step.
+        self.burning = np.empty(self.shape, dtype=bool)
+        self.spread = np.empty(self.shape, dtype=bool)
+        self.scratch = np.empty(self.shape, dtype=bool)
+        self.stamp = None
+
+        self.steps = 0
+        # Flat indices of the burning cells, kept up to date by both kinds of step.
+        self.front = np.flatnonzero(ignition)
+        self.burning_counts = [len(self.front)]
+        self.bounds = self.front_bounds()
+
+    def front_bounds(self):
+        if len(self.front) == 0:
+            return None
+        rows, columns = np.divmod(self.front, self.shape[1])
+        return (int(rows.min()), int(rows.max()) + 1), (int(columns.min()), int(columns.max()) + 1)
+
+    def window(self):
+        # Bounding box of the burning cells grown by the neighbourhood radius, nothing outside it can change.
+        (top, bottom), (left, right) = self.bounds
+        return (slice(max(top - self.radius, 0), min(bottom + self.radius, self.shape[0])),
+                slice(max(left - self.radius, 0), min(right + self.radius, self.shape[1])))
+
+    def step(self):
+        if self.bounds is None:
+            return 0
+        window = self.window()
+        window_size = (window[0].stop - window[0].start) * (window[1].stop - window[1].start)
+        # A thin front, like the ring of an expanding fire, is cheaper to follow cell by cell than
+        # to stencil its whole bounding box.
+        if 8 * len(self.front) < window_size:
+            ignited = self.step_front()
+        else:
+            ignited = self.step_window(window)
+        self.bounds = self.front_bounds()
+        self.steps += 1
+        self.burning_counts.append(len(self.front))
+        return ignited
+
+    def step_window(self, window):
+        state = self.state[window]
+        burn_time = self.burn_time[window]
+        burning = self.burning[window]
+        spread = self.spread[window]
+        scratch = self.scratch[window]
+
+        np.equal(state, BURNING, out=burning)
+        spread[...] = False
+        for k, offset in enumerate(self.offsets):
+            dst, src = shifted_slices(offset, burning.shape)
+            if self.certain:
+                np.logical_or(spread[dst], burning[src], out=spread[dst])
+            else:
+                probability = self.spread_probability[k][window][src] if self.directional else self.spread_probability
+                np.less(self.random_number_generator.random(burning[src].shape), probability, out=scratch[dst])
+                np.logical_and(scratch[dst], burning[src], out=scratch[dst])
+                np.logical_or(spread[dst], scratch[dst], out=spread[dst])
+        np.equal(state, UNBURNT, out=scratch)
+        np.logical_and(spread, scratch, out=spread)
+        np.logical_and(spread, self.fuel[window], out=spread)
+
+        # Burning cells age by one step and burn out, then the newly ignited cells start burning.
+        np.subtract(burn_time, 1, out=burn_time, where=burning)
+        np.equal(burn_time, 0, out=scratch)
+        np.logical_and(scratch, burning, out=scratch)
+        state[scratch] = BURNT
+        state[spread] = BURNING
+        burn_time[spread] = self.burn_duration
+
+        np.equal(state, BURNING, out=burning)
+        rows, columns = np.nonzero(burning)
+        self.front = (rows + window[0].start) * self.shape[1] + (columns + window[1].start)
+        return int(np.count_nonzero(spread))
+
+    def step_front(self):
+        size_y, size_x = self.shape
+        state = self.state.ravel()
+        burn_time = self.burn_time.ravel()
+        rows, columns = np.divmod(self.front, size_x)
+        candidates = []
+        for k, (dy, dx) in enumerate(self.offsets):
+            inside = (rows + dy >= 0) & (rows + dy < size_y) & (columns + dx >= 0) & (columns + dx < size_x)
+            sources = self.front[inside]
+            neighbours = sources + (dy * size_x + dx)
+            if not self.certain:
+                probability = self.spread_probability[k].ravel()[sources] if self.directional else self.spread_probability
+                neighbours = neighbours[self.random_number_generator.random(len(neighbours)) < probability]
+            candidates.append(neighbours)
+        candidates = np.concatenate(candidates)
+        candidates = candidates[(state[candidates] == UNBURNT) & self.fuel.ravel()[candidates]]
+        # Several burning cells can ignite the same cell, keep one copy of each.
+        if self.stamp is None:
+            self.stamp = np.empty(state.size, dtype=np.intp)
+        order = np.arange(len(candidates))
+        self.stamp[candidates] = order
+        candidates = candidates[self.stamp[candidates] == order]
+
+        burn_time[self.front] -= 1
+        burnt_out = burn_time[self.front] == 0
+        state[self.front[burnt_out]] = BURNT
+        state[candidates] = BURNING
+        burn_time[candidates] = self.burn_duration
+        self.front = np.concatenate([self.front[~burnt_out], candidates])
+        return len(candidates)
+
+    def run(self, max_steps=1000):
+        # Steps until no cell is burning or the step budget is used up, returns the steps taken.
+        start = self.steps
+        while self.bounds is not None and self.steps - start < max_steps:
+            self.step()
+        return self.steps - start
+
+    @property
+    def is_burning(self):
+        return self.bounds is not None
+
+    def burnt_area(self):
+        # Cells that are burning or have burnt.
+        return self.state != UNBURNT
+
+
+def spread_forest(forest, max_steps=1000, fuel=None, **kwargs):
+    # Spreads the fires of forest.wildfires, the cells they ignite stay in forest.burnt_area.
+    spread = FireSpread(forest.wildfires, fuel=fuel, **kwargs)
+    spread.run(max_steps=max_steps)
+    forest.burnt_area = spread.burnt_area()
+    return spread
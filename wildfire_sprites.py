@@ -0,0 +1,179 @@
+import json
+import os
+import pickle
+from random import Random
+
+import numpy as np
+
+
+# Sprite locations are an (size_x, size_y, 3) float array holding the canvas x, y and the
+# scale of the sprite drawn for each cell, indexed the same way as the old str([x, y]) keys.
+SPRITE_X, SPRITE_Y, SPRITE_SCALE = range(3)
+
+
+def empty_sprite_locations(size_x, size_y):
+    return np.zeros((size_x, size_y, 3))
+
+
+def sprite_locations_from_dict(locations, shape=None):
+    cells = [json.loads(key) for key in locations]
+    if shape is None:
+        shape = tuple(np.max(cells, axis=0) + 1) if cells else (0, 0)
+    sprite_locations = empty_sprite_locations(*shape)
+    for (x, y), location in zip(cells, locations.values()):
+        sprite_locations[x, y] = location
+    return sprite_locations
+
+
+def as_sprite_locations(locations):
+    if isinstance(locations, dict):
+        return sprite_locations_from_dict(locations)
+    return np.asarray(locations, dtype=float)
+
+
+def random_sprite_layout(seed, canvas_size_x, canvas_size_y, size_x, size_y):
+    random = Random(seed)
+    sprite_locations = empty_sprite_locations(size_x, size_y)
+    for x in range(size_x):
+        for y in range(size_y):
+            # Choose a random sprite position
+            pos_x = random.randint(-10,10) + 200+canvas_size_x*x/size_x
+            pos_y = random.randint(-10,10) + canvas_size_y*y/size_y
+            pos_x = 200+canvas_size_x*x/size_x
+            pos_y = canvas_size_y*y/size_y
+            # Choose a random sprite size
+            scale = random.uniform(0.6, 1.5)
+            sprite_locations[x, y] = pos_x, pos_y, scale
+    return sprite_locations
+
+
+def mountain_layout(seed, count=1000):
+    # Positions and scales of the mountains drawn along the western edge of the terrain.
+    random = Random(seed)
+    mountains = []
+    for _ in range(count):
+        pos_x = random.randint(0, 180)
+        pos_y = random.randint(0, 780)
+        scale = random.uniform(0.4, 1.2)
+        mountains.append((pos_x, pos_y, scale))
+    return mountains
+
+
+def save_sprite_locations(path, sprite_locations):
+    np.save(path, as_sprite_locations(sprite_locations))
+
+
+def load_sprite_locations(path, mmap_mode=None):
+    # Also reads the str([x, y])-keyed dicts pickled by older notebooks.
+    if os.path.splitext(path)[1] == ".pkl":
+        with open(path, "rb") as pickle_file:
+            return sprite_locations_from_dict(pickle.load(pickle_file))
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def fill_sprite_cells(canvas, sprite_locations, mask, size, offset=0):
+    # One fill_rects command for all selected cells instead of a fill_rect message per cell.
+    locations = sprite_locations[np.asarray(mask, dtype=bool)]
+    if len(locations) == 0:
+        return
+    canvas.fill_rects(locations[:, SPRITE_X] + offset,
+                      locations[:, SPRITE_Y] + offset,
+                      size * locations[:, SPRITE_SCALE])
+
+
+def dilate_cells(mask):
+    # Grows a mask by one cell in every direction, including diagonals.
+    grown = mask.copy()
+    grown[1:] |= mask[:-1]
+    grown[:-1] |= mask[1:]
+    rows = grown.copy()
+    grown[:, 1:] |= rows[:, :-1]
+    grown[:, :-1] |= rows[:, 1:]
+    return grown
+
+
+def update_sprite_cells(canvas, sprite_locations, previous_mask, mask, size, offset=0, margin=3):
+    # Sends draw and clear commands only for the cells that differ from previous_mask, the mask
+    # drawn by the last call on this canvas. Pass None to repaint the whole overlay.
+    mask = np.asarray(mask, dtype=bool)
+    if previous_mask is None or previous_mask.shape != mask.shape:
+        canvas.clear()
+        fill_sprite_cells(canvas, sprite_locations, mask, size, offset)
+        return mask
+
+    removed = previous_mask & ~mask
+    added = mask & ~previous_mask
+    for x, y, scale in sprite_locations[removed]:
+        canvas.clear_rect(x + offset - margin, y + offset - margin, size * scale + 2 * margin)
+    # Scaled rectangles can overlap their neighbours, so those are filled again after a clear.
+    fill_sprite_cells(canvas, sprite_locations, added | (mask & dilate_cells(removed)), size, offset)
+    return mask
+
+
+class SpriteIndex:
+    def __init__(self, sprite_locations, size, offset=0):
+        # Uniform grid of buckets as large as the largest sprite, so every sprite box overlaps at
+        # most 2x2 buckets and a click only tests the few sprites listed in its own bucket.
+        sprite_locations = np.asarray(sprite_locations, dtype=float)
+        self.shape = sprite_locations.shape[:2]
+        locations = sprite_locations.reshape(-1, 3)
+        left = locations[:, SPRITE_X] + offset
+        top = locations[:, SPRITE_Y] + offset
+        extent = size * locations[:, SPRITE_SCALE]
+        self.boxes = np.stack([left, top, left + extent, top + extent], axis=1)
+
+        if len(locations) == 0:
+            self.origin_x = self.origin_y = 0.0
+            self.bucket_size = 1.0
+            self.columns = self.rows = 0
+            self.items = np.empty(0, dtype=np.intp)
+            self.starts = np.zeros(1, dtype=np.intp)
+            return
+
+        self.origin_x = float(left.min())
+        self.origin_y = float(top.min())
+        self.bucket_size = max(float(extent.max()), 1.0)
+        first_columns, last_columns = self.bucket_of(left, self.origin_x), self.bucket_of(left + extent, self.origin_x)
+        first_rows, last_rows = self.bucket_of(top, self.origin_y), self.bucket_of(top + extent, self.origin_y)
+        self.columns = int(last_columns.max()) + 1
+        self.rows = int(last_rows.max()) + 1
+
+        items = []
+        buckets = []
+        sprites = np.arange(len(locations))
+        for column_step in (0, 1):
+            for row_step in (0, 1):
+                columns = first_columns + column_step
+                rows = first_rows + row_step
+                overlaps = (columns <= last_columns) & (rows <= last_rows)
+                items.append(sprites[overlaps])
+                buckets.append(rows[overlaps] * self.columns + columns[overlaps])
+        items = np.concatenate(items)
+        buckets = np.concatenate(buckets)
+        order = np.argsort(buckets, kind="stable")
+        self.items = items[order]
+        self.starts = np.searchsorted(buckets[order], np.arange(self.columns * self.rows + 1))
+
+    def bucket_of(self, coordinates, origin):
+        return np.floor((coordinates - origin) / self.bucket_size).astype(np.intp)
+
+    def sprite_at(self, x, y):
+        # Index into the flattened sprite locations of the sprite under (x, y), or None.
+        column = int(np.floor((x - self.origin_x) / self.bucket_size))
+        row = int(np.floor((y - self.origin_y) / self.bucket_size))
+        if not (0 <= column < self.columns and 0 <= row < self.rows):
+            return None
+        bucket = row * self.columns + column
+        candidates = self.items[self.starts[bucket]:self.starts[bucket + 1]]
+        boxes = self.boxes[candidates]
+        hits = candidates[(boxes[:, 0] <= x) & (x < boxes[:, 2]) & (boxes[:, 1] <= y) & (y < boxes[:, 3])]
+        if len(hits) == 0:
+            return None
+        # Cells are drawn in index order, so where sprites overlap the last one is on top.
+        return int(hits.max())
+
+    def cell_at(self, x, y):
+        sprite = self.sprite_at(x, y)
+        if sprite is None:
+            return None
+        return divmod(sprite, self.shape[1])
@@ -5,92 +5,31 @@ from ipycanvas import Canvas, hold_canvas
 from ipycanvas import RoughCanvas as Canvas
 from IPython.display import HTML, clear_output
 
-from random import choice, randint, uniform
+from random import Random
+
+from wildfire_conditions import seed_sequence
+from wildfire_core import RAIN_RULES as WILDFIRE_RULES, ColabForest as Forest
+from wildfire_sprites import SPRITE_SCALE, SPRITE_X, SPRITE_Y, SpriteIndex, empty_sprite_locations, fill_sprite_cells
+from wildfire_widgets import WidgetCache
 
 
 global lightning
 global rain
 global temperature
 
-class Forest:
-    def __init__(self):
-        self.temperature = None
-        self.rain = None
-        self.lightning = None
-        self.wildfires = None
-        size_x = 20
-        size_y = 20
-        self.construct_wildfire_matrix(size_x, size_y, probability_of_rain=0.4, probability_of_lightning=0.2, highest_temperature=90)
-
-    def generate_specific_forest_conditions(self, size_of_x, size_of_y, probability_of_rain, probability_of_lightning, highest_temperature):
-        random_number_generator = np.random.default_rng()
-        lightning = random_number_generator.binomial(n=1, p=probability_of_lightning, size=(size_of_x, size_of_y))
-        rain = random_number_generator.binomial(n=1, p=probability_of_rain, size=(size_of_x, size_of_y))
-        lowest_temperature_vector = random_number_generator.normal(0, 1, size=(size_of_x)) * 10
-        highest_temperature_vector = lowest_temperature_vector + highest_temperature - max(lowest_temperature_vector)
-        temperature = np.linspace(start=lowest_temperature_vector, stop=highest_temperature_vector, num=size_of_x, dtype=int)
-        for idx in range(len(temperature)):
-            temperature[idx] = np.convolve(temperature[idx], [0.25,0.25,0.25,0.25], mode='same')
-        temperature += highest_temperature - np.max(temperature)
-        #temperature = np.flip(temperature).T
-        return lightning, rain, temperature
-        
-    def construct_annotation_matrix(self, lightning, rain, temperature):
-        annotations = np.empty_like(lightning, dtype='<U48')
-        for i in range(annotations.shape[0]):
-            for j in range(annotations.shape[1]):
-                raining_txt = "True" if rain[i][j] else "False"
-                lightning_txt = "True" if lightning[i][j] else "False"
-                annotations[i][j] = 'Rain: ' +  raining_txt +\
-                                    '<br>Temp: ' + str(temperature[i][j]) +\
-                                    '<br>Lightning: ' + lightning_txt
-        return annotations
-        
-    def construct_wildfire_matrix(self, size_x, size_y, probability_of_rain = 0.3, probability_of_lightning = 0.4, highest_temperature=85):
-        self.lightning, self.rain, self.temperature = self.generate_specific_forest_conditions(size_of_x=size_x,
-                                                                               size_of_y=size_y,
-                                                                               probability_of_rain=probability_of_rain,
-                                                                               probability_of_lightning=probability_of_lightning,
-                                                                               highest_temperature=highest_temperature)
-
-        def is_area_on_fire(x_coordinate, y_coordinate, lightning, rain, temperature):
-            if lightning[x_coordinate, y_coordinate] == True:
-                area_on_fire = True
-            elif temperature[x_coordinate, y_coordinate] > 55 and rain[x_coordinate, y_coordinate] == True:
-                area_on_fire = True
-            else:
-                area_on_fire = False
-            return area_on_fire
-        wildfires = np.empty_like(self.lightning)
-        for i in range(wildfires.shape[0]):
-            for j in range(wildfires.shape[1]):
-                wildfires[i][j] = is_area_on_fire(i, j, self.lightning, self.rain, self.temperature)
-        self.wildfires = wildfires
-        return wildfires
-
-    def predict_area_on_fire(self, x_coordinate, y_coordinate, lightning_value, temp_value, rain_value):
-        if bool(self.lightning[x_coordinate, y_coordinate]) == (lightning_value == "Yes"):
-            area_on_fire = True
-        elif self.temperature[x_coordinate, y_coordinate] > temp_value and bool(self.rain[x_coordinate, y_coordinate]) == (rain_value == "Yes"):
-            area_on_fire = True
-        else:
-            area_on_fire = False
-        return area_on_fire
-        
-    def is_lightning(self, x_coordinate, y_coordinate):
-        return bool(self.lightning[y_coordinate, x_coordinate])
-        
-    def is_rainshadow(self, x_coordinate, y_coordinate):
-        return bool(self.rain[y_coordinate, x_coordinate])
-        
-    def get_temperature(self, x_coordinate, y_coordinate):
-        return self.temperature[y_coordinate, x_coordinate]
-
-
-
 class Drawer:
-    def __init__(self, forest):
-        self.sprite_locations  = {}
+    # Sprites and terrain are shared by all drawers. The terrain only depends on its seed
+    # and size, so it is rendered once into an offscreen canvas and blitted on every redraw.
+    # Every unseeded drawer has a terrain of its own, only the last few are kept.
+    sprite_atlas = {}
+    terrain_cache = WidgetCache(max_size=4)
+
+    def __init__(self, forest, seed=None):
+        # Terrain and sprite placement are drawn from their own streams so the same seed always gives the same layout.
+        self.terrain_seed, self.layout_seed = (int(state) for state in seed_sequence(seed).generate_state(2))
+        self.layout_key = None
+        self.sprite_locations  = empty_sprite_locations(0, 0)
+        self.sprite_index = SpriteIndex(self.sprite_locations, size=15, offset=50)
         self.annotation = ""
         self.forest = forest
         #canvas_size_x = 800
@@ -98,40 +37,21 @@ class Drawer:
         #canvas = self.draw_canvas(forest, canvas_size_x=canvas_size_x, canvas_size_y=canvas_size_y, size_x=30, size_y=30)
         #display(canvas)
 
-    def draw_canvas(self, 
-                    forest, 
-                    canvas_size_x, 
-                    canvas_size_y, 
-                    size_x, 
-                    size_y, 
-                    draw_predictions=False,
-                    predictions=None,
-                    lightning_input=None,
-                    temperature_input=None,
-                    rain_shadow_input=None):
-        self.forest = forest
-        self.canvas_size_x = canvas_size_x
-        self.canvas_size_y = canvas_size_y
-        self.size_x = size_x
-        self.size_y = size_y
-        
-        tree_sprite = Image.from_file("sprites/tree1.png")
-        fire_sprite = Image.from_file("sprites/fire.png")
-        mountain_sprite = Image.from_file("sprites/mountain.png")
-        
-        sprites = []
-        sprites.append(Canvas(width=20, height=20))
-        sprites[0].draw_image(tree_sprite, 0, 0, width=20, height=20)
-        
-        sprites.append(Canvas(width=20, height=20))
-        sprites[1].draw_image(fire_sprite, 0, 0, width=20, height=20)
-        
-        sprites.append(Canvas(width=20, height=20))
-        sprites[2].draw_image(mountain_sprite, 0, 0, width=20, height=20)
-    
-        wildfire_state = forest.wildfires
-        
-        canvas = Canvas(width=1500, height=1000//2)
+    def load_sprites(self):
+        if not self.sprite_atlas:
+            for name, path in (("tree", "sprites/tree1.png"), ("fire", "sprites/fire.png"), ("mountain", "sprites/mountain.png")):
+                self.sprite_atlas[name] = Image.from_file(path)
+        return self.sprite_atlas
+
+    def draw_terrain(self, width=1500, height=1000//2):
+        key = (self.terrain_seed, width, height)
+        terrain = self.terrain_cache.get(key)
+        if terrain is not None:
+            return terrain
+
+        random = Random(self.terrain_seed)
+        mountain_sprite = self.load_sprites()["mountain"]
+        canvas = Canvas(width=width, height=height)
         canvas.translate(100//2, 100//2)
         
         canvas.fill_style = "#93cc5e"
@@ -153,7 +73,7 @@ class Drawer:
         canvas.fill_style = "#000000"
         canvas.font = "30px helvetica"
         
-        with hold_canvas(canvas):
+        with hold_canvas():
             center_align = 400//2
             canvas.stroke_line(1100//2+1, center_align, 1400//2, center_align)
             canvas.stroke_line(1400//2-10, center_align+10, 1400//2, center_align)
@@ -162,82 +82,84 @@ class Drawer:
             canvas.font = "18px Comic Sans MS"
             canvas.fill_text("Click on the forest to view details here", 1500//2, 400//2)
     
-        with hold_canvas(canvas):
+        with hold_canvas():
             for _ in range(1000//2):
-                canvas.save()
-                sprite = mountain_sprite
-        
-                # Choose a random sprite position
-                pos_x = randint(0, 180//2)
-                pos_y = randint(0, 780//2)
-        
-                # Choose a random rotation angle (but first set the rotation center with `translate`)
-                canvas.translate(pos_x, pos_y)
-        
-                # Choose a random sprite size
-                canvas.scale(uniform(0.4, 1.2))
-        
-                # Restore the canvas center
-                canvas.translate(-pos_x, -pos_y)
-        
-                # Draw the sprite
-                canvas.draw_image(sprite, pos_x, pos_y, height=15, width=15)
+                # Choose a random sprite position and size
+                pos_x = random.randint(0, 180//2)
+                pos_y = random.randint(0, 780//2)
+                scale = random.uniform(0.4, 1.2)
+                canvas.draw_image(mountain_sprite, pos_x, pos_y, height=15*scale, width=15*scale)
+
+        return self.terrain_cache.put(key, canvas)
+
+    def layout_sprites(self, canvas_size_x, canvas_size_y, size_x, size_y):
+        key = (canvas_size_x, canvas_size_y, size_x, size_y)
+        if key == self.layout_key:
+            return self.sprite_locations
+
+        sprite_locations = empty_sprite_locations(size_x, size_y)
+        x, y = np.meshgrid(np.arange(size_x), np.arange(size_y), indexing="ij")
+        sprite_locations[..., SPRITE_X] = 200//2+canvas_size_x*x/size_x
+        sprite_locations[..., SPRITE_Y] = canvas_size_y*y/size_y
+        # Random jitter and scales are turned off in this version
+        sprite_locations[..., SPRITE_SCALE] = 1
+
+        self.layout_key = key
+        self.sprite_locations = sprite_locations
+        # Sprites are drawn 15*scale wide after the canvas is translated by (50, 50).
+        self.sprite_index = SpriteIndex(sprite_locations, size=15, offset=50)
+        return sprite_locations
+
+    def draw_canvas(self, 
+                    forest, 
+                    canvas_size_x, 
+                    canvas_size_y, 
+                    size_x, 
+                    size_y, 
+                    draw_predictions=False,
+                    lightning_input=None,
+                    temperature_input=None,
+                    rain_shadow_input=None):
+        self.forest = forest
+        self.canvas_size_x = canvas_size_x
+        self.canvas_size_y = canvas_size_y
+        self.size_x = size_x
+        self.size_y = size_y
+        sprites = self.load_sprites()
+        sprite_locations = self.layout_sprites(canvas_size_x, canvas_size_y, size_x, size_y)
+        wildfire_state = forest.wildfires
         
-                canvas.restore()
-            
+        canvas = Canvas(width=1500, height=1000//2)
+        with hold_canvas():
+            canvas.draw_image(self.draw_terrain())
+            canvas.translate(100//2, 100//2)
+            canvas.fill_style = "#000000"
+            canvas.font = "18px Comic Sans MS"
+
             for x in range(size_x):
                 for y in range(size_y):
-                    canvas.save()
-                    if wildfire_state[y,x]:
-                        sprite = fire_sprite
-                    else:
-                        sprite = tree_sprite
-                
-                    # Choose a random sprite position
-                    #pos_x = randint(-10,10) + 200//2+canvas_size_x*x/size_x 
-                    #pos_y = randint(-10,10) + canvas_size_y*y/size_y
-                    pos_x = 200//2+canvas_size_x*x/size_x 
-                    pos_y = canvas_size_y*y/size_y
-        
-                    # Choose a random rotation angle (but first set the rotation center with `translate`)
-                    #canvas.translate(pos_x, pos_y)
-            
-                    # Choose a random sprite size
-                    #scale = uniform(0.6, 1.5)
-                    scale=1
-                    canvas.scale(scale)
-                    self.sprite_locations[str([x,y])] = pos_x, pos_y, scale
-            
-                    # Restore the canvas center
-                    #canvas.translate(-pos_x, -pos_y)
-
-                    # Draw the sprite
-                    canvas.draw_image(sprite, pos_x, pos_y, height=15, width=15)
-                    #canvas.fill_rect(pos_x, pos_y, height=15, width=15)
+                    sprite = sprites["fire"] if wildfire_state[y,x] else sprites["tree"]
+                    pos_x, pos_y, scale = sprite_locations[x, y]
+                    canvas.draw_image(sprite, pos_x, pos_y, height=15*scale, width=15*scale)
 
-                    canvas.restore()
             canvas.fill_style = "#ff3636"
             canvas.roughness = 0
             canvas.line_width = 4.0
             canvas.rough_fill_style = "solid"
 
             if draw_predictions:
-                for i in range(predictions.shape[0]):
-                    for j in range(predictions.shape[1]):
-                        if forest.predict_area_on_fire(i, j, lightning_input.value, temperature_input.value, rain_shadow_input.value) != forest.wildfires[i][j]:
-                            x, y, scale = self.sprite_locations[str([i, j])]
-                            canvas.scale(scale)
-                            #canvas.draw_image(fire_sprite, x, y, height=15, width=15)
-                            canvas.fill_rect(x, y, height=15*scale, width=15*scale)
+                _, mismatches, _ = forest.predict_grid(lightning_input.value, temperature_input.value, rain_shadow_input.value)
+                fill_sprite_cells(canvas, self.sprite_locations, mismatches, size=15)
         
 
         out = Output()
         @out.capture()
         def handle_mouse_down(x, y):
+            cell = self.sprite_index.cell_at(x, y)
             x = x-50
             y = y-50
-            coord_x = int(size_x*(x-100)/canvas_size_x)
-            coord_y = int(size_y*y/canvas_size_y)
+            # Clicks between sprites fall back to the cell of the grid square under the cursor.
+            coord_x, coord_y = cell if cell is not None else (int(size_x*(x-100)/canvas_size_x), int(size_y*y/canvas_size_y))
             if coord_x > size_x-1 or coord_y > size_y-1 or coord_x < 0 or coord_y < 0:
                 return
             annotation = f'The selected area ({coord_x}, {coord_y}) is '
@@ -247,7 +169,8 @@ class Drawer:
             else:
                 annotation += "not burning."
             annotation += f'The temperature is {forest.get_temperature(coord_x, coord_y)}°C.It is '
-            if forest.is_rainshadow(coord_x, coord_y):
+            # The colab rain layer is the Rain-Shadow input of RAIN_RULES, True marks a dry rain-shadow cell.
+            if forest.is_raining(coord_x, coord_y):
                 annotation += 'a rainshadow area.There are '
             else:
                 annotation += 'not a rainshadow area.There are '
@@ -255,7 +178,7 @@ class Drawer:
                 annotation += 'lightning strikes in the area.'
             else:
                 annotation += 'no lightning strikes in the area.'
-            with hold_canvas(canvas):
+            with hold_canvas():
                 canvas.restore()
                 canvas.clear_rect(x=1100//2, y=0, width=800, height=2000//2)
                 canvas_width = 1500
@@ -294,14 +217,12 @@ class Drawer:
         lightning_input = widgets.Dropdown(value="No", options=["No", "Yes"], layout=widgets.Layout(width="200px", padding="0px"))
         rain_shadow_input = widgets.Dropdown(value="No", options=["No", "Yes"], layout=widgets.Layout(width="200px", padding="0px"))
 
-        predictions = np.random.randint(2, size=forest.wildfires.shape)
         canvas = self.draw_canvas(forest, 
                                   canvas_size_x=canvas_size_x, 
                                   canvas_size_y=canvas_size_y, 
                                   size_x=20, 
                                   size_y=20, 
                                   draw_predictions=False,
-                                  predictions=predictions,
                                   lightning_input=lightning_input,
                                   temperature_input=temperature_input,
                                   rain_shadow_input=rain_shadow_input)
@@ -326,14 +247,12 @@ class Drawer:
         lightning_input = widgets.Dropdown(value=lightning_value, options=["No", "Yes"], layout=widgets.Layout(width="200px", padding="0px"))
         rain_shadow_input = widgets.Dropdown(value=rain_shadow_value, options=["No", "Yes"], layout=widgets.Layout(width="200px", padding="0px"))
 
-        predictions = np.random.randint(2, size=forest.wildfires.shape)
         canvas = self.draw_canvas(forest, 
                                   canvas_size_x=canvas_size_x, 
                                   canvas_size_y=canvas_size_y, 
                                   size_x=20, 
                                   size_y=20, 
                                   draw_predictions=True,
-                                  predictions=predictions,
                                   lightning_input=lightning_input,
                                   temperature_input=temperature_input,
                                   rain_shadow_input=rain_shadow_input)
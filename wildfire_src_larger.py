@@ -1,132 +1,140 @@
+import base64
+import importlib.util
+
 import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 import ipywidgets as widgets
 from ipywidgets import HBox, Label
-from IPython.display import HTML, display
+from IPython.display import HTML, clear_output, display
+
+from wildfire_core import LargerForest
+from wildfire_headless import encode_png
 
 global lightning
 global rain
 global temperature
 
-class Forest:
-    def __init__(self):
-        self.temperature = None
-        self.rain = None
-        self.lightning = None
+# FigureWidget needs anywidget. Without it the figure is a plain go.Figure that is redrawn in an
+# Output widget, which can not call back into Python when a cell is hovered.
+FIGURE_WIDGET = importlib.util.find_spec("anywidget") is not None
+
+# Above this many cells the heatmap, which sends a hover text per cell, is replaced by a
+# PNG image of the forest that the browser draws as a single bitmap.
+IMAGE_MODE_CELLS = 100 * 100
+
+# colorblind colors: https://davidmathlogic.com/colorblind/#%23E63452-%231E88E5-%23FFC107-%23004D40
+RED = "#E63452"
+GREEN = "#05D0EA"
+IMAGE_COLORS = np.array([[0x05, 0xD0, 0xEA], [0xE6, 0x34, 0x52]], dtype=np.uint8)
+
+
+def forest_image_source(wildfires):
+    image = IMAGE_COLORS[np.asarray(wildfires, dtype=bool).astype(np.uint8)]
+    return "data:image/png;base64," + base64.b64encode(encode_png(image)).decode("ascii")
+
+
+class Forest(LargerForest):
+    def __init__(self, seed=None, size_x=None, size_y=None):
+        # One FigureWidget is kept for the lifetime of the forest and updated in place.
+        self.figure = None
+        self.image_mode = None
+        self.figure_displayed = False
+        # Hovering a cell shows its conditions here, looked up for that one cell.
+        self.details = widgets.HTML()
+        self.view = widgets.VBox() if FIGURE_WIDGET else widgets.Output()
+        super().__init__(seed=seed, size_x=size_x, size_y=size_y)
 
-    def regenerate_forest(self, probability_of_rain, probability_of_lightning, highest_temperature, display_f=True):
-        def plot_state(inputs, labels):
+    def build_figure(self, image_mode):
+        figure_class = go.FigureWidget if FIGURE_WIDGET else go.Figure
+        if image_mode:
+            # The hover label only has the coordinate, the conditions of the cell are shown in the
+            # details panel. Without anywidget there is no panel and image mode shows coordinates only.
+            figure = figure_class(data=go.Image(source=None,
+                                                hovertemplate='Coordinate: %{x},%{y}<extra></extra>'))
+            # Image traces reverse the y axis by default, the heatmap keeps row 0 at the bottom.
+            figure.update_yaxes(autorange=True)
+        else:
             #green = px.colors.qualitative.Set2[4]
             #red = px.colors.qualitative.Set1[0]
-            # colorblind colors: https://davidmathlogic.com/colorblind/#%23E63452-%231E88E5-%23FFC107-%23004D40
-            red = "#E63452"
-            green = "#05D0EA"
-            fig = go.Figure(data=go.Heatmap(
-                                z=inputs,
-                                text=labels,
-                                texttemplate="",#"%{text}",
-                                textfont={"size":30},
+            figure = figure_class(data=go.Heatmap(
+                                z=None,
                                 xgap=1,
                                 ygap=1,
-                                colorscale=[(0.00, green),   (0.5, green),
-                                        (0.5, red),  (1.00, red)],
+                                colorscale=[(0.00, GREEN),   (0.5, GREEN),
+                                        (0.5, RED),  (1.00, RED)],
+                                zmin=0,
+                                zmax=1,
                                 colorbar=dict(
                                     tickfont={"size":20},
                                     tickmode="array",
                                     tickvals=[0, 0.25, 0.75, 1],
                                     ticktext=["", "Not Burning", "Burning", ""],
                                     ticks="inside"),
-                                hovertemplate = 'Coordinate: %{x},%{y}<br>'+'%{text}<extra></extra>',
+                                hovertemplate = 'Coordinate: %{x},%{y}<extra></extra>' if FIGURE_WIDGET else 'Coordinate: %{x},%{y}<br>'+'%{text}<extra></extra>',
             ))
-            
-            if display_f:
-              fig.update_layout(
-                  autosize=True,
-                  width=900,
-                  height=800,
-                  plot_bgcolor="#fff",
-                  hoverlabel=dict(
-                      bgcolor="white",
-                      font_size=15,
-                  ),
-                  title={
-                      'text': "Simulation of Forest Wildfires",
-                      'x':0.46,
-                      'xanchor': 'center',
-                      'yanchor': 'top',
-                      'font': dict(size=30)
-                  },
-              )
+        if FIGURE_WIDGET:
+            figure.data[0].on_hover(self.show_details)
+        figure.update_layout(
+            autosize=True,
+            width=900,
+            height=800,
+            plot_bgcolor="#fff",
+            hoverlabel=dict(
+                bgcolor="white",
+                font_size=15,
+            ),
+            title={
+                'text': "Simulation of Forest Wildfires",
+                'x':0.46,
+                'xanchor': 'center',
+                'yanchor': 'top',
+                'font': dict(size=30)
+            },
+        )
+        return figure
+
+    def show_details(self, trace, points, state):
+        if points.xs:
+            self.details.value = self.annotation_at(int(points.xs[0]), int(points.ys[0]))
+
+    def update_figure(self, wildfires):
+        image_mode = wildfires.size > IMAGE_MODE_CELLS
+        if self.figure is None or image_mode != self.image_mode:
+            self.figure = self.build_figure(image_mode)
+            self.image_mode = image_mode
+            if FIGURE_WIDGET:
+                self.view.children = (self.figure, self.details)
+
+        # Only properties whose values changed are sent to the frontend, in one message.
+        trace = self.figure.data[0]
+        with self.figure.batch_update():
+            if image_mode:
+                trace.source = forest_image_source(wildfires)
             else:
-              fig.update_layout(
-                autosize=True,
-                width=10,
-                height=10,
-                plot_bgcolor="#fff",
-                hoverlabel=dict(
-                    bgcolor="white",
-                    font_size=1,
-                ),
-                title={
-                    'text': "Simulation of Forest Wildfires",
-                    'x':0.46,
-                    'xanchor': 'center',
-                    'yanchor': 'top',
-                    'font': dict(size=2)
-                },
-            )
-
-            return fig
-            
-        def generate_specific_forest_conditions(size_of_x, size_of_y, probability_of_rain, probability_of_lightning, highest_temperature):
-            random_number_generator = np.random.default_rng()
-            lightning = random_number_generator.binomial(n=1, p=probability_of_lightning, size=(size_of_x, size_of_y))
-            rain = random_number_generator.binomial(n=1, p=probability_of_rain, size=(size_of_x, size_of_y))
-            lowest_temperature_vector = random_number_generator.normal(0, 1, size=(size_of_x)) * 10
-            highest_temperature_vector = lowest_temperature_vector + highest_temperature - max(lowest_temperature_vector)
-            temperature = np.linspace(start=lowest_temperature_vector, stop=highest_temperature_vector, num=size_of_x, dtype=int)
-            for idx in range(len(temperature)):
-                temperature[idx] = np.convolve(temperature[idx], [0.25,0.25,0.25,0.25], mode='same')
-            temperature += highest_temperature - np.max(temperature)
-            temperature = np.flip(temperature).T
-            return lightning, rain, temperature
-            
-        def construct_annotation_matrix(lightning, rain, temperature):
-            annotations = np.empty_like(lightning, dtype='<U48')
-            for i in range(annotations.shape[0]):
-                for j in range(annotations.shape[1]):
-                    raining_txt = "True" if rain[i][j] else "False"
-                    lightning_txt = "True" if lightning[i][j] else "False"
-                    annotations[i][j] = 'Rain: ' +  raining_txt +\
-                                        '<br>Temp: ' + str(temperature[i][j]) +\
-                                        '<br>Lightning: ' + lightning_txt
-            return annotations
-            
-        def construct_wildfire_matrix(lightning, rain, temperature):
-            def is_area_on_fire(x_coordinate, y_coordinate, lightning, rain, temperature):
-                if lightning[x_coordinate, y_coordinate] == True:
-                    area_on_fire = True
-                elif temperature[x_coordinate, y_coordinate] > 55 and rain[x_coordinate, y_coordinate] == False:
-                    area_on_fire = True
-                else:
-                    area_on_fire = False
-                return area_on_fire
-            wildfires = np.empty_like(lightning)
-            for i in range(wildfires.shape[0]):
-                for j in range(wildfires.shape[1]):
-                    wildfires[i][j] = is_area_on_fire(i, j, lightning, rain, temperature)
-            return wildfires
-            
-        self.lightning, self.rain, self.temperature = generate_specific_forest_conditions(size_of_x=35,
-                                                                                           size_of_y=35,
-                                                                                           probability_of_rain=probability_of_rain,
-                                                                                           probability_of_lightning=probability_of_lightning,
-                                                                                           highest_temperature=highest_temperature)
-        annotations = construct_annotation_matrix(self.lightning, self.rain, self.temperature)
-        wildfires = construct_wildfire_matrix(self.lightning, self.rain, self.temperature)
-        fig = plot_state(wildfires, annotations)
-        display(fig)
+                z = wildfires.astype(np.uint8)
+                if trace.z is None or not np.array_equal(trace.z, z):
+                    trace.z = z
+                if not FIGURE_WIDGET:
+                    # Without hover callbacks the heatmap carries the text of every cell, at most IMAGE_MODE_CELLS of them.
+                    trace.text = self.construct_annotation_matrix(self.lightning, self.rain, self.temperature)
+        if not FIGURE_WIDGET:
+            with self.view:
+                clear_output(wait=True)
+                display(self.figure)
+        return self.figure
+
+    def regenerate_forest(self, probability_of_rain, probability_of_lightning, highest_temperature, display_f=True, seed=None):
+        wildfires = self.construct_wildfire_matrix(size_x=self.size_x,
+                                                   size_y=self.size_y,
+                                                   probability_of_rain=probability_of_rain,
+                                                   probability_of_lightning=probability_of_lightning,
+                                                   highest_temperature=highest_temperature,
+                                                   seed=seed)
+        self.update_figure(wildfires)
+        if display_f and not self.figure_displayed:
+            display(self.view)
+            self.figure_displayed = True
         #return fig
     
     def display_forest(self):
@@ -147,20 +155,13 @@ class Forest:
                                                 step=1,
                                                 readout=True)
         
-        output = widgets.interactive_output(self.regenerate_forest, {'probability_of_rain': probability_of_rain,
-                                                                    'probability_of_lightning': probability_of_lightning,
-                                                                    'highest_temperature': highest_temperature})
-        self.regenerate_forest(probability_of_rain.value, probability_of_lightning.value, highest_temperature.value, display_f=False)
+        def on_value_change(change):
+            self.regenerate_forest(probability_of_rain.value, probability_of_lightning.value, highest_temperature.value, display_f=False)
+
+        for slider in (probability_of_rain, probability_of_lightning, highest_temperature):
+            slider.observe(on_value_change, names='value')
+        on_value_change(None)
         widget = widgets.GridBox([widgets.GridBox([HBox([Label('Probability of Rain'), probability_of_rain]),
                                                    HBox([Label('Probability of Lightning'), probability_of_lightning]),
-                                                   HBox([Label('Highest Temperature'), highest_temperature])]), output])
+                                                   HBox([Label('Highest Temperature'), highest_temperature])]), self.view])
         return widget
-
-    def is_lightning(self, x_coordinate, y_coordinate):
-        return bool(self.lightning[y_coordinate, x_coordinate])
-        
-    def is_raining(self, x_coordinate, y_coordinate):
-        return bool(self.rain[y_coordinate, x_coordinate])
-        
-    def get_temperature(self, x_coordinate, y_coordinate):
-        return self.temperature[y_coordinate, x_coordinate]
@@ -0,0 +1,87 @@
+import json
+import os
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+
+from wildfire_conditions import TEMPERATURE_DTYPE
+
+
+FORMAT_NAME = "wildfire-forest"
+# Version 2 added the elevation and rain_shadow layers, version 1 forests load without them.
+FORMAT_VERSION = 2
+FOREST_LAYERS = ("lightning", "rain", "temperature", "wildfires", "elevation", "rain_shadow")
+
+# A saved forest is a directory holding header.json and one .npy file per layer. The .npy
+# files are opened as memory maps, so loading is zero-copy and works for grids larger than RAM.
+
+
+def save_forest(forest, path):
+    os.makedirs(path, exist_ok=True)
+    header = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "layers": {}}
+    for layer in FOREST_LAYERS:
+        values = getattr(forest, layer, None)
+        if values is None:
+            continue
+        values = np.asarray(values)
+        filename = layer + ".npy"
+        np.save(os.path.join(path, filename), values)
+        header["layers"][layer] = {"file": filename, "dtype": values.dtype.str, "shape": list(values.shape)}
+
+    scenario_seed = getattr(forest, "scenario_seed", None)
+    if isinstance(scenario_seed, np.random.SeedSequence):
+        header["seed"] = {"entropy": scenario_seed.entropy, "spawn_key": list(scenario_seed.spawn_key)}
+
+    with open(os.path.join(path, "header.json"), "w") as header_file:
+        json.dump(header, header_file, indent=2)
+
+
+def load_header(path):
+    with open(os.path.join(path, "header.json")) as header_file:
+        header = json.load(header_file)
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} is not a saved forest")
+    if header.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"{path} uses format version {header['version']}, only up to {FORMAT_VERSION} is supported")
+    return header
+
+
+def load_layers(path, mmap_mode="r"):
+    header = load_header(path)
+    return {layer: np.load(os.path.join(path, description["file"]), mmap_mode=mmap_mode)
+            for layer, description in header["layers"].items()}
+
+
+def load_forest(path, forest=None, mmap_mode="r"):
+    # Fills the layers of an existing Forest, or a plain namespace when no forest is given. Layers
+    # the file does not have, like the terrain of a version 1 forest, are reset to None so nothing
+    # of the forest's previous scenario is left next to the loaded one.
+    if forest is None:
+        forest = SimpleNamespace(**{layer: None for layer in FOREST_LAYERS})
+    layers = load_layers(path, mmap_mode=mmap_mode)
+    for layer in FOREST_LAYERS:
+        setattr(forest, layer, layers.get(layer))
+
+    seed = load_header(path).get("seed")
+    forest.scenario_seed = None if seed is None else np.random.SeedSequence(seed["entropy"], spawn_key=seed["spawn_key"])
+    return forest
+
+
+class PickledForestUnpickler(pickle.Unpickler):
+    # Forests pickled from a notebook refer to __main__.Forest, which only exists inside that notebook.
+    def find_class(self, module, name):
+        if module == "__main__":
+            return SimpleNamespace
+        return super().find_class(module, name)
+
+
+def convert_pickled_forest(pickle_path, path):
+    with open(pickle_path, "rb") as pickle_file:
+        forest = PickledForestUnpickler(pickle_file).load()
+    # Old pickles hold int64 layers, store them in the compact dtypes used by Forest today.
+    for layer in ("lightning", "rain", "wildfires"):
+        setattr(forest, layer, np.asarray(getattr(forest, layer), dtype=bool))
+    forest.temperature = np.asarray(forest.temperature).astype(TEMPERATURE_DTYPE)
+    save_forest(forest, path)
+    return forest
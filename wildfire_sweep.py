@@ -0,0 +1,105 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from wildfire_conditions import seed_sequence
+
+
+# Ranges of the sliders in Drawer.draw_canvas_with_controls.
+LIGHTNING_VALUES = np.arange(0, 101)
+RAIN_VALUES = np.arange(0, 101)
+TEMPERATURE_VALUES = np.arange(40, 151)
+
+METRICS = ("burned_cells", "burned_fraction", "lightning_cells", "raining_cells", "mean_temperature")
+
+
+class ForestSweep:
+    def __init__(self, forest, size_x=20, size_y=20, seed=None, max_bytes=64 * 2**20):
+        # All slider positions share one scenario seed, so moving a slider changes the
+        # conditions of the same forest instead of drawing a new one.
+        self.forest = forest
+        self.size_x = size_x
+        self.size_y = size_y
+        self.seed_sequence = forest.seed_sequence if seed is None else seed_sequence(seed)
+        self.seed_key = (self.seed_sequence.entropy, tuple(self.seed_sequence.spawn_key))
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def scenario(self, lightning_value, rain_value, temperature_value, cache=True):
+        # Scenarios are generated into their own arrays, only apply changes what the forest shows.
+        # With cache=False a missing scenario is computed without evicting the cached slider positions.
+        key = (self.seed_key, float(lightning_value), float(rain_value), float(temperature_value), self.size_x, self.size_y)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        self.misses += 1
+        lightning, rain, temperature = self.forest.generate_specific_forest_conditions(size_of_x=self.size_x,
+                                                                                      size_of_y=self.size_y,
+                                                                                      probability_of_rain=rain_value/100,
+                                                                                      probability_of_lightning=lightning_value/100,
+                                                                                      highest_temperature=temperature_value,
+                                                                                      seed=self.seed_sequence)
+        wildfires = self.forest.wildfire_rules.evaluate({"lightning": lightning, "rain": rain, "temperature": temperature})
+        state = {"lightning": lightning,
+                 "rain": rain,
+                 "temperature": temperature,
+                 "wildfires": wildfires.astype(lightning.dtype)}
+        for layer in state.values():
+            layer.flags.writeable = False
+        state["metrics"] = {"burned_cells": int(np.count_nonzero(state["wildfires"])),
+                            "burned_fraction": float(np.count_nonzero(state["wildfires"]) / state["wildfires"].size),
+                            "lightning_cells": int(np.count_nonzero(lightning)),
+                            "raining_cells": int(np.count_nonzero(rain)),
+                            "mean_temperature": float(np.mean(temperature))}
+        if not cache:
+            return state
+
+        self.cache[key] = state
+        self.cache_bytes += state_bytes(state)
+        while self.cache_bytes > self.max_bytes and len(self.cache) > 1:
+            _, evicted_state = self.cache.popitem(last=False)
+            self.cache_bytes -= state_bytes(evicted_state)
+        return state
+
+    def apply(self, lightning_value, rain_value, temperature_value):
+        state = self.scenario(lightning_value, rain_value, temperature_value)
+        self.forest.lightning = state["lightning"]
+        self.forest.rain = state["rain"]
+        self.forest.temperature = state["temperature"]
+        self.forest.wildfires = state["wildfires"]
+        self.forest.scenario_seed = self.seed_sequence
+        return state["wildfires"]
+
+    def metrics(self, lightning_value, rain_value, temperature_value, cache=True):
+        return self.scenario(lightning_value, rain_value, temperature_value, cache=cache)["metrics"]
+
+    def response_surface(self, lightning_values=LIGHTNING_VALUES, rain_values=RAIN_VALUES, temperature_values=TEMPERATURE_VALUES):
+        # The grid points are streamed past the cache, a full surface has far more of them than it holds.
+        shape = (len(lightning_values), len(rain_values), len(temperature_values))
+        surface = {metric: np.empty(shape) for metric in METRICS}
+        for i, lightning_value in enumerate(lightning_values):
+            for j, rain_value in enumerate(rain_values):
+                for k, temperature_value in enumerate(temperature_values):
+                    metrics = self.metrics(lightning_value, rain_value, temperature_value, cache=False)
+                    for metric in METRICS:
+                        surface[metric][i, j, k] = metrics[metric]
+        surface["lightning_values"] = np.asarray(lightning_values)
+        surface["rain_values"] = np.asarray(rain_values)
+        surface["temperature_values"] = np.asarray(temperature_values)
+        return surface
+
+    def export_response_surface(self, path, **values):
+        np.savez_compressed(path, **self.response_surface(**values))
+
+    def clear(self):
+        self.cache.clear()
+        self.cache_bytes = 0
+
+
+def state_bytes(state):
+    return sum(layer.nbytes for name, layer in state.items() if name != "metrics")
@@ -0,0 +1,106 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from wildfire_raster import open_raster
+from wildfire_rules import WILDFIRE_RULES, compile_rules
+from wildfire_spread import FireSpread, neighbourhood_offsets
+
+
+# Evaluates grids that do not fit in memory one tile at a time. The layers are read from memory
+# maps or raster files, see wildfire_raster, and the result is written to a .npy memory map, so
+# only the tiles being worked on are held in memory.
+DEFAULT_TILE_SHAPE = (2048, 2048)
+
+
+def tile_windows(shape, tile_shape=DEFAULT_TILE_SHAPE):
+    # (rows, columns) slices covering the grid in row major order, the last row and column of
+    # tiles are cut at the border.
+    tile_rows, tile_columns = tile_shape
+    if tile_rows < 1 or tile_columns < 1:
+        raise ValueError(f"Tiles need at least one row and column, got tile_shape {tile_shape}")
+    return [(slice(top, min(top + tile_rows, shape[0])), slice(left, min(left + tile_columns, shape[1])))
+            for top in range(0, shape[0], tile_rows)
+            for left in range(0, shape[1], tile_columns)]
+
+
+def halo_window(window, halo, shape):
+    # The tile grown by halo cells on every side that lies inside the grid, and the slices that
+    # cut the tile itself back out of it.
+    rows, columns = window
+    top, left = max(rows.start - halo, 0), max(columns.start - halo, 0)
+    grown = (slice(top, min(rows.stop + halo, shape[0])), slice(left, min(columns.stop + halo, shape[1])))
+    inner = (slice(rows.start - top, rows.stop - top), slice(columns.start - left, columns.stop - left))
+    return grown, inner
+
+
+def open_output(output, shape, dtype=bool):
+    # A path is created as a .npy memory map, arrays and memory maps are written into as they are.
+    if isinstance(output, (str, os.PathLike)):
+        return np.lib.format.open_memmap(output, mode="w+", dtype=dtype, shape=shape)
+    if output.shape != shape:
+        raise ValueError(f"The output has shape {output.shape}, the condition layers {shape}")
+    return output
+
+
+def rules_tile_function(rules=WILDFIRE_RULES):
+    wildfire_rules = compile_rules(rules)
+    return lambda tile_layers: wildfire_rules.evaluate(tile_layers)
+
+
+def spread_tile_function(rules=WILDFIRE_RULES, steps=1, neighbourhood="moore"):
+    # The cells the fires started by rules reach within steps steps, spreading to every
+    # neighbour with fuel. A "fuel" layer is used when one is given. Only deterministic spread
+    # can be tiled, random draws would differ between overlapping tiles.
+    wildfire_rules = compile_rules(rules)
+
+    def spread_tile(tile_layers):
+        spread = FireSpread(wildfire_rules.evaluate(tile_layers), fuel=tile_layers.get("fuel"), neighbourhood=neighbourhood)
+        spread.run(max_steps=steps)
+        return spread.burnt_area()
+    return spread_tile
+
+
+def spread_halo(steps=1, neighbourhood="moore"):
+    # A fire moves at most the neighbourhood radius per step, so this is all it can cross.
+    return steps * max(max(abs(dy), abs(dx)) for dy, dx in neighbourhood_offsets(neighbourhood))
+
+
+def evaluate_tiled(layers, output, rules=WILDFIRE_RULES, tile_shape=DEFAULT_TILE_SHAPE, halo=0, workers=None,
+                   tile_function=None, dtype=bool):
+    # layers maps the condition names to arrays, memory maps or raster files of the same shape,
+    # e.g. wildfire_storage.load_layers of a saved forest. tile_function maps a dict of tile
+    # layers to the result of that tile and defaults to evaluating rules. When it looks at
+    # neighbouring cells, halo is how far, every tile is then read with that many cells around
+    # it so the cells at its border see the same neighbours as on the full grid.
+    # Peak memory is about workers tiles with their halos, times the number of layers.
+    if halo < 0:
+        raise ValueError(f"halo can not be negative, got {halo}")
+    if tile_function is None:
+        tile_function = rules_tile_function(rules)
+    rasters = {name: open_raster(source) for name, source in layers.items()}
+    shapes = {name: raster.shape for name, raster in rasters.items()}
+    if len(set(shapes.values())) != 1:
+        raise ValueError(f"Condition layers have different shapes: {shapes}")
+    shape = next(iter(shapes.values()))
+    result = open_output(output, shape, dtype=dtype)
+
+    def evaluate_tile(window):
+        grown, inner = halo_window(window, halo, shape)
+        tile_layers = {name: np.asarray(raster[grown]) for name, raster in rasters.items()}
+        result[window] = np.asarray(tile_function(tile_layers))[inner]
+
+    windows = tile_windows(shape, tile_shape)
+    if not workers or workers < 2:
+        for window in windows:
+            evaluate_tile(window)
+    else:
+        # numpy releases the GIL while it compares and copies the tiles, so threads are enough
+        # and the tiles can be written straight into the shared output.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(evaluate_tile, windows):
+                pass
+    if isinstance(result, np.memmap):
+        result.flush()
+    return result
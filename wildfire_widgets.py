@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+import ipywidgets as widgets
+from ipycanvas import MultiRoughCanvas
+
+
+def close_widget(widget):
+    # Layout and style are widgets of their own and stay registered unless closed too.
+    for part in (getattr(widget, "layout", None), getattr(widget, "style", None)):
+        if isinstance(part, widgets.Widget):
+            part.close()
+    widget.close()
+
+
+def multi_rough_canvas(n_canvases=3, **kwargs):
+    # MultiRoughCanvas skips MultiCanvas.__init__ (ipycanvas 0.14), which is where the top layer is
+    # hooked up to the frontend, so mouse and client ready callbacks would never fire without this.
+    layers = MultiRoughCanvas(n_canvases, **kwargs)
+    handler = layers[-1]._handle_frontend_event
+    if handler not in layers._msg_callbacks.callbacks:
+        layers.on_msg(handler)
+    return layers
+
+
+class WidgetCache:
+    def __init__(self, max_size=4):
+        # Keeps the max_size most recently used widgets, e.g. offscreen terrain canvases, and
+        # closes the ones it evicts so their frontend models are released too.
+        self.max_size = max_size
+        self.widgets = OrderedDict()
+
+    def get(self, key):
+        widget = self.widgets.get(key)
+        if widget is not None:
+            self.widgets.move_to_end(key)
+        return widget
+
+    def put(self, key, widget):
+        self.widgets[key] = widget
+        self.widgets.move_to_end(key)
+        while len(self.widgets) > self.max_size:
+            _, evicted_widget = self.widgets.popitem(last=False)
+            close_widget(evicted_widget)
+        return widget
+
+    def clear(self):
+        while self.widgets:
+            close_widget(self.widgets.popitem()[1])
+
+    def __len__(self):
+        return len(self.widgets)